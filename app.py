@@ -1,23 +1,161 @@
 import os
 import json
+import time
+import base64
 import asyncio
+import tempfile
+from collections import deque
 import chainlit as cl
 from dotenv import load_dotenv
 from pathlib import Path
 
-# アプリケーション自体のモジュールをインポート
-from src.agent import AIAgent
-from src.browser import BrowserAutomation
-
-# .envファイルからの環境変数読み込み
+# .envファイルからの環境変数読み込み（src のモジュールは読み込み時に環境変数を参照するため、先に行う）
 dotenv_path = Path(__file__).resolve().parent / '.env'
 load_dotenv(dotenv_path)
 
+# アプリケーション自体のモジュールをインポート
+from src.agent import AIAgent
+from src.browser import BrowserAutomation, CancelToken, RunCancelledError
+from src.pool import BrowserPool
+
 # OpenAI APIキーを環境変数から取得
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your_openai_api_key_here")
 
 # グローバル変数
 agent = None
+# 全セッションで共有するブラウザプール（Chromiumの起動を毎回行わず、メモリ増加時はリサイクルする）
+browser_pool = None
+
+# 抽出結果としてチャットに表示する最新行の数（全件はJSONLファイルで添付する）
+PREVIEW_ROWS = 20
+
+# 抽出結果の表示を更新する最小間隔（秒）
+PREVIEW_INTERVAL = 1.0
+
+
+def format_rows_preview(step: str, rows, count: int) -> str:
+    """
+    抽出行のプレビューをMarkdownテーブルに整形する
+    
+    Args:
+        step: ステップ番号
+        rows: 表示する行のリスト
+        count: これまでに抽出された行数
+        
+    Returns:
+        Markdown文字列
+    """
+    headers = []
+    for row in rows:
+        for key in row:
+            if key not in headers:
+                headers.append(key)
+    md = f"📄 ステップ {step} の抽出結果: {count}行（最新{len(rows)}行を表示）\n\n"
+    if headers:
+        md += "| " + " | ".join(headers) + " |\n"
+        md += "| " + " | ".join(['---'] * len(headers)) + " |\n"
+        for row in rows:
+            md += "| " + " | ".join([str(row.get(h, "")).replace("|", "\\|").replace("\n", " ") for h in headers]) + " |\n"
+    return md
+
+
+async def stream_execution(browser: BrowserAutomation, steps, cancel_token: CancelToken = None) -> dict:
+    """
+    ステップを実行しながら、進捗と抽出行をチャットに逐次表示する
+    
+    各ステップはcl.Stepとして表示し、開始・完了・所要時間・エラー・サムネイルをリアルタイムで反映する。
+    抽出行はステップごとに最新PREVIEW_ROWS行のみ保持し、全行は一時JSONLファイルに書き出して最後に添付する。
+    
+    Args:
+        browser: ブラウザ自動化のインスタンス
+        steps: 実行するステップリスト
+        cancel_token: 実行を中断するためのトークン
+        
+    Returns:
+        {"rows": 抽出された行数, "status": run_finishedのstatus, "failed_steps": エラーになったステップ番号のリスト}
+    """
+    ui_steps = {}
+    previews = {}
+    total = 0
+    status = "ok"
+    failed_steps = []
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as rows_file:
+        async for record in browser.stream_steps(steps, cancel_token=cancel_token):
+            if record["type"] == "step_started":
+                # ブランチ内のステップ（"3.1.2"）は親ステップ（"3"）の下に表示する
+                label = record["step"]
+                parent = ui_steps.get(label.rsplit(".", 2)[0]) if "." in label else None
+                ui_step = cl.Step(name=f"ステップ {label}: {record['action']}", type="tool",
+                                  parent_id=parent.id if parent else None)
+                ui_step.input = label
+                ui_steps[label] = ui_step
+                await ui_step.send()
+                continue
+            
+            if record["type"] == "step_finished":
+                ui_step = ui_steps.get(record["step"])
+                if ui_step:
+                    if record["status"] == "error":
+                        failed_steps.append(record["step"])
+                        ui_step.output = f"❌ {record['error']}（{record['duration_ms']} ms）"
+                        ui_step.is_error = True
+                    else:
+                        ui_step.output = f"✅ 完了（{record['duration_ms']} ms）"
+                    await ui_step.update()
+                continue
+            
+            if record["type"] == "run_finished":
+                status = record["status"]
+                continue
+            
+            if record["type"] == "thumbnail":
+                ui_step = ui_steps.get(record["step"])
+                if ui_step:
+                    await cl.Image(
+                        name=f"step_{record['step']}.jpg",
+                        content=base64.b64decode(record["data"]),
+                        display="inline"
+                    ).send(for_id=ui_step.id)
+                continue
+            
+            if record["type"] == "error":
+                if record.get("reason"):
+                    # 中断はRunCancelledErrorとして呼び出し元で通知する
+                    continue
+                await cl.Message(content=f"❌ 操作実行中にエラーが発生しました: {record['message']}").send()
+                continue
+            
+            if record["type"] != "row":
+                continue
+            rows_file.write(json.dumps({"step": record["step"], "data": record["data"]}, ensure_ascii=False) + "\n")
+            total += 1
+            
+            preview = previews.get(record["step"])
+            if preview is None:
+                preview = {"message": cl.Message(content=""), "rows": deque(maxlen=PREVIEW_ROWS), "count": 0, "updated": 0.0}
+                previews[record["step"]] = preview
+                await preview["message"].send()
+            preview["rows"].append(record["data"])
+            preview["count"] += 1
+            
+            # 更新頻度を抑えてブラウザ側の処理を妨げないようにする
+            if time.monotonic() - preview["updated"] >= PREVIEW_INTERVAL:
+                preview["message"].content = format_rows_preview(record["step"], preview["rows"], preview["count"])
+                await preview["message"].update()
+                preview["updated"] = time.monotonic()
+    
+    for step, preview in previews.items():
+        preview["message"].content = format_rows_preview(step, preview["rows"], preview["count"])
+        await preview["message"].update()
+    
+    if total:
+        await cl.Message(
+            content=f"抽出された全{total}行をJSONLファイルとして添付します。",
+            elements=[cl.File(name="extracted_rows.jsonl", path=rows_file.name, display="inline")]
+        ).send()
+    else:
+        os.remove(rows_file.name)
+    return {"rows": total, "status": status, "failed_steps": failed_steps}
 
 
 @cl.on_chat_start
@@ -25,11 +163,15 @@ async def setup():
     """
     チャットセッション開始時の初期化処理
     """
-    global agent
+    global agent, browser_pool
     
     # AIエージェントの初期化
     agent = AIAgent(OPENAI_API_KEY)
     
+    # ブラウザプールは最初のセッションで作成する（イベントループ上で作成する必要があるため）
+    if browser_pool is None:
+        browser_pool = BrowserPool()
+    
     # ウェルカムメッセージを表示
     await cl.Message(
         content="# 🤖 Web-AI-Agent へようこそ！\n\n"
@@ -53,6 +195,15 @@ async def main(message: cl.Message):
     # ユーザーからの指示
     instruction = message.content
     
+    # ブラウザプールの統計を表示するコマンド
+    if instruction.strip() == "/stats":
+        stats = await browser_pool.stats(include_context_memory=True)
+        await cl.Message(content="ブラウザプールの統計:\n```json\n" + json.dumps(stats, indent=2, ensure_ascii=False) + "\n```").send()
+        if agent.intents is not None:
+            planner = agent.intents.stats()
+            await cl.Message(content="定型指示の処理の統計:\n```json\n" + json.dumps(planner, indent=2, ensure_ascii=False) + "\n```").send()
+        return
+    
     # 処理中であることを通知
     processing_msg = cl.Message(content="OpenAI APIを使用して操作ステップを生成中...")
     await processing_msg.send()
@@ -75,6 +226,9 @@ async def main(message: cl.Message):
             action = step.get("action", "")
             selector = step.get("selector", "")
             value = step.get("value", "")
+            if action == "parallel":
+                # 並行実行ステップはブランチ名を値として表示
+                value = ", ".join(b.get("name", "") if isinstance(b, dict) else f"{len(b)}ステップ" for b in step.get("branches", []))
             table_data["rows"].append([str(action), str(selector), str(value)])
         
         # Markdownテーブルの生成
@@ -105,17 +259,23 @@ async def main(message: cl.Message):
             await cl.Message(content="ブラウザでステップを実行中...").send()
 
             # BrowserAutomationのインスタンスを作成
-            browser = BrowserAutomation()
-
-            # ステップの詳細を出力
-            steps_debug = "\n".join([f"- {s.get('action', '')}: {s.get('selector', '')} {s.get('value', '')}" for s in steps])
-            await cl.Message(content=f"実行するステップの詳細:\n```\n{steps_debug}\n```").send()
+            browser = BrowserAutomation(pool=browser_pool)
 
             # 実行結果を返すタスクを作成
+            # 停止ボタンから中断できるよう、セッションにトークンを保持する
+            cancel_token = CancelToken()
+            cl.user_session.set("cancel_token", cancel_token)
             try:
                 # 直接実行して例外をキャッチ
-                await browser.run_steps(steps)
-                await cl.Message(content="✅ 操作が完了しました！").send()
+                outcome = await stream_execution(browser, steps, cancel_token)
+                if outcome["status"] == "error":
+                    await cl.Message(content="❌ エラーにより操作を中止しました。").send()
+                elif outcome["failed_steps"]:
+                    await cl.Message(content=f"⚠️ 操作は終了しましたが、エラーになったステップがあります: {', '.join(outcome['failed_steps'])}").send()
+                else:
+                    await cl.Message(content="✅ 操作が完了しました！").send()
+            except RunCancelledError as e:
+                await cl.Message(content=f"⏹ 操作を中断しました: {e}").send()
             except Exception as e:
                 import traceback
                 error_details = traceback.format_exc()
@@ -127,6 +287,18 @@ async def main(message: cl.Message):
         await cl.Message(content=f"エラーが発生しました: {e}").send()
 
 
+@cl.on_stop
+async def on_stop():
+    """
+    ユーザーが停止ボタンを押した時の処理
+    
+    実行中のステップを中断し、ブラウザのコンテキストとブラウザを閉じる。
+    """
+    cancel_token = cl.user_session.get("cancel_token")
+    if cancel_token:
+        cancel_token.cancel("停止ボタンが押されました")
+
+
 if __name__ == "__main__":
     # ローカルで実行する場合のエントリーポイント
     # chainlit run app.py -w
@@ -5,76 +5,138 @@
 AIエージェントモジュール - 自然言語からJSON操作ステップへの変換を行う
 """
 
+import os
 import json
-from typing import List, Dict, Any
-import openai
+from typing import List, Dict, Any, Optional
 
+from src.intent import IntentMatcher
 
-class AIAgent:
-    """
-    自然言語からPlaywright操作ステップへの変換を行うAIエージェントクラス
-    """
-    
-    def __init__(self, api_key: str):
-        """
-        AIエージェントの初期化
-        
-        Args:
-            api_key: OpenAI APIキー
-        """
-        self.api_key = api_key
-        self.client = openai.OpenAI(api_key=api_key)
-    
-    async def generate_steps(self, instruction: str) -> List[Dict[str, Any]]:
-        """
-        自然言語の指示からJSONステップを生成する
-        
-        Args:
-            instruction: ユーザーからの自然言語指示
-            
-        Returns:
-            UIアクションのステップリスト（JSON形式）
-        """
-        # プロンプトを作成
-        system_prompt = """
+
+# ステップ生成に使うモデル（環境変数 OPENAI_MODEL で変更できる）
+DEFAULT_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4.1-nano-2025-04-14")
+
+# ステップ生成のシステムプロンプト
+SYSTEM_PROMPT = """
         あなたはWebサイト操作の自動化を支援するAIです。
         ユーザーの自然言語による指示をJSONフォーマットの操作ステップに変換してください。
         
         以下のアクションタイプを使用できます：
         - open_url: Webサイトを開く（valueにURLを指定）
         - click: 要素をクリック（selectorに要素のセレクタを指定）
-        - type: テキストを入力（selectorに要素のセレクタ、valueに入力テキストを指定）
+        - type: テキストを入力（selectorに要素のセレクタ、valueに入力テキストを指定。入力後にEnterキーで送信する場合は "submit": true を指定）
         - wait: 特定の時間待機（valueにミリ秒を指定）
         - select: ドロップダウンから選択（selectorに要素のセレクタ、valueに選択肢の値を指定）
+        - extract_text: 要素のテキストを取得（selectorに要素のセレクタ、attributeを指定するとその属性値を取得）
+        - extract_list: 繰り返し要素から項目を取得（selectorに各項目のセレクタ、fieldsに {"項目名": "子要素のセレクタ"} を指定。属性値は "a@href" のように指定）
+        - extract_table: 表を行ごとに取得（selectorにtable要素のセレクタを指定）
+          抽出アクションでは、nextに「次へ」リンクのセレクタ、max_pagesに最大ページ数、limitに最大行数を指定できます
+        - parallel: 互いに独立した複数の作業を別タブで同時に実行（branchesに {"name": 名前, "steps": ステップ配列} の配列を指定）
         
         特別な考慮事項：
+        - 「サイトAとサイトBで価格を比較する」のように、互いの結果に依存しない複数サイトでの作業はparallelでまとめてください。各ブランチは新しいタブで開始されるため、最初のステップはopen_urlにしてください。
         - Googleを開く場合、ログイン確認ダイアログが表示されることがあります。その場合は「ログインしない」または「No thanks」ボタンをクリックするステップを追加してください。
         - reCAPTCHA（「私はロボットではありません」チェックボックス）が検出された場合は、自動でクリックするステップを含めてください。セレクタとして ".recaptcha-checkbox-border" や "//span[@role='checkbox']" を試してみてください。
         - 複雑なreCAPTCHAについては、"//iframe[contains(@title, 'reCAPTCHA')]" などのセレクタを使ってiframeを特定し、そのiframeにfocusしてから操作を行うようにしてください。
         - Googleの検索ボックスには通常 "input[name='q']" または "textarea[name='q']" セレクタを使用します。
+        - 検索ボックスに入力して検索する場合は、typeステップに "submit": true を指定してください。続けて別のフィールドに入力する場合は "submit": false を指定してください。
         - クリック操作の前に、対象要素が視認できることを確認するため、wait操作を追加することを推奨します。
         
         レスポンスは必ず以下のJSON形式の配列で返してください：
         [
           {"action": "open_url", "value": "https://example.com"},
           {"action": "click", "selector": "text='ログイン'"},
-          {"action": "type", "selector": "#username", "value": "user1"}
+          {"action": "type", "selector": "#username", "value": "user1", "submit": false}
+        ]
+        
+        parallelを使う場合の例：
+        [
+          {"action": "parallel", "branches": [
+            {"name": "siteA", "steps": [{"action": "open_url", "value": "https://a.example.com"}]},
+            {"name": "siteB", "steps": [{"action": "open_url", "value": "https://b.example.com"}]}
+          ]}
         ]
         
         JSONのみを返し、説明などは不要です。
         """
+
+
+class AIAgent:
+    """
+    自然言語からPlaywright操作ステップへの変換を行うAIエージェントクラス
+    
+    定型の指示（URLを開く、主要サイトでの検索など）はLLMを呼び出さずに IntentMatcher でステップに変換する。
+    generate_steps の呼び出しごとのトークン使用量と、応答をステップとして解釈できなかった回数、
+    定型の指示として処理した回数を usage に累計する（直近の呼び出し分は last_usage）。
+    空のステップが返った場合、APIの呼び出し自体の失敗は last_usage["api_error"]、
+    応答を解釈できなかった場合は last_usage["parse_error"] に内容が入る。
+    """
+    
+    def __init__(self, api_key: str, model: Optional[str] = None, system_prompt: Optional[str] = None,
+                 client=None, temperature: float = 0.2, fast_path: Optional[bool] = None):
+        """
+        AIエージェントの初期化
+        
+        Args:
+            api_key: OpenAI APIキー
+            model: 使用するモデル（指定がない場合は DEFAULT_MODEL）
+            system_prompt: システムプロンプト（指定がない場合は SYSTEM_PROMPT）
+            client: chat.completions.create を持つクライアント（評価用の記録済み応答など。指定がない場合はOpenAI API）
+            temperature: 生成時のtemperature
+            fast_path: 定型の指示をLLMを使わずに処理する（指定がない場合は環境変数 INTENT_FAST_PATH、デフォルトは有効）
+        """
+        self.api_key = api_key
+        self.model = model or DEFAULT_MODEL
+        self.system_prompt = system_prompt or SYSTEM_PROMPT
+        self.temperature = temperature
+        if client is None:
+            import openai
+            client = openai.AsyncOpenAI(api_key=api_key)
+        self.client = client
+        if fast_path is None:
+            fast_path = os.environ.get("INTENT_FAST_PATH", "true").lower() == "true"
+        self.intents = IntentMatcher() if fast_path else None
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "parse_failures": 0, "fast_path_hits": 0}
+        self.last_usage: Dict[str, Any] = {}
+    
+    async def generate_steps(self, instruction: str) -> List[Dict[str, Any]]:
+        """
+        自然言語の指示からJSONステップを生成する
+        
+        Args:
+            instruction: ユーザーからの自然言語指示
+            
+        Returns:
+            UIアクションのステップリスト（JSON形式）
+        """
+        self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0, "parse_failure": False, "fast_path": False}
+        
+        # 定型の指示であればLLMを呼び出さずにステップを返す
+        if self.intents is not None:
+            matched = self.intents.match(instruction)
+            if matched:
+                print(f"定型の指示としてステップを生成しました: {matched['intent']}")
+                self.usage["fast_path_hits"] += 1
+                self.last_usage["fast_path"] = True
+                return matched["steps"]
         
         try:
             # ChatGPT APIにリクエスト
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-nano-2025-04-14",  # 適切なモデルを指定
+            response = await self.client.chat.completions.create(
+                model=self.model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": instruction}
                 ],
-                temperature=0.2  # より決定論的な応答を得るため低い値を設定
+                temperature=self.temperature  # より決定論的な応答を得るため低い値を設定
             )
-            
+            self._record_usage(getattr(response, "usage", None))
+        except Exception as e:
+            # 通信エラーやレート制限など、APIの呼び出し自体の失敗（パース失敗とは区別する）
+            print(f"エラー: JSONステップの生成に失敗しました: {e}")
+            self.last_usage["api_error"] = str(e)
+            return []
+        
+        try:
             # レスポンスからJSONステップを抽出
             steps_json = response.choices[0].message.content.strip()
             
@@ -86,8 +148,28 @@ class AIAgent:
                 steps_json = steps_json[start_idx:end_idx]
                 
             steps = json.loads(steps_json)
+            if not isinstance(steps, list):
+                raise ValueError("ステップが配列ではありません")
             return steps
         
         except Exception as e:
             print(f"エラー: JSONステップの生成に失敗しました: {e}")
+            self.usage["parse_failures"] += 1
+            self.last_usage["parse_failure"] = True
+            self.last_usage["parse_error"] = str(e)
             return []
+    
+    def _record_usage(self, usage) -> None:
+        """
+        APIの応答に含まれるトークン使用量を記録する
+        
+        Args:
+            usage: 応答のusage（prompt_tokens, completion_tokens を持つオブジェクト）
+        """
+        self.usage["requests"] += 1
+        if usage is None:
+            return
+        for name in ("prompt_tokens", "completion_tokens"):
+            tokens = getattr(usage, name, 0) or 0
+            self.usage[name] += tokens
+            self.last_usage[name] = tokens
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP APIモジュール - 他のサービスから自動化ジョブを投入・監視するための非同期HTTP API
+
+起動方法:
+    uvicorn src.api:app --host 127.0.0.1 --port 8000
+    または
+    python -m src.api
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel
+
+# .envファイルからの環境変数読み込み（src のモジュールは読み込み時に環境変数を参照するため、先に行う）
+dotenv_path = Path(__file__).resolve().parent.parent / '.env'
+load_dotenv(dotenv_path)
+
+from src.agent import AIAgent
+from src.browser import BrowserAutomation, CancelToken, RunCancelledError, first_step_error
+from src.pool import BrowserPool
+
+# ジョブの成果物（スクリーンショット・抽出行）の保存先
+ARTIFACTS_DIR = Path(os.environ.get("API_ARTIFACTS_DIR", "artifacts"))
+
+# 受け付け済みで未完了のジョブ数の上限（超えた場合は429を返す）
+API_MAX_PENDING_JOBS = int(os.environ.get("API_MAX_PENDING_JOBS", "1000"))
+
+# 同時にステップを生成する（OpenAI APIを呼び出す）ジョブ数
+API_MAX_PLANNING = int(os.environ.get("API_MAX_PLANNING", "8"))
+
+# 完了後も状態を保持しておくジョブ数
+API_MAX_FINISHED_JOBS = int(os.environ.get("API_MAX_FINISHED_JOBS", "1000"))
+
+# 生成したステップの実行確認（/confirm）を待つ時間（秒）。過ぎたジョブはキャンセルする
+API_CONFIRMATION_TIMEOUT = float(os.environ.get("API_CONFIRMATION_TIMEOUT", "600"))
+
+# ジョブごとに保持する最新イベント数（抽出行は全件 rows.jsonl に書き出す）
+JOB_EVENT_BUFFER = 1000
+
+# 完了状態
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobRequest(BaseModel):
+    """
+    ジョブの投入リクエスト（instruction と steps のどちらかを指定する）
+    """
+    instruction: Optional[str] = None
+    steps: Optional[List[Dict[str, Any]]] = None
+    # Trueの場合は生成したステップを確認なしで実行する（Falseの場合は /confirm を待つ）
+    skip_confirmation: bool = False
+    # 実行全体の制限時間（ミリ秒）
+    timeout: Optional[int] = None
+
+
+class BulkJobRequest(BaseModel):
+    """
+    複数ジョブの一括投入リクエスト
+    """
+    jobs: List[JobRequest]
+
+
+class Job:
+    """
+    1つの自動化ジョブの状態とイベント
+    """
+    
+    def __init__(self, request: JobRequest):
+        """
+        Args:
+            request: 投入リクエスト
+        """
+        self.id = uuid.uuid4().hex
+        self.instruction = request.instruction
+        self.steps = request.steps
+        self.skip_confirmation = request.skip_confirmation
+        self.timeout = request.timeout
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.row_count = 0
+        self.results: Optional[List[Dict[str, Any]]] = None
+        self.confirmation_deadline: Optional[float] = None
+        self.artifacts_dir = ARTIFACTS_DIR / self.id
+        self.cancel_token = CancelToken()
+        self.confirmed = asyncio.Event()
+        self.events: deque = deque(maxlen=JOB_EVENT_BUFFER)
+        self.seq = 0
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+    
+    def record(self, event: Dict[str, Any]) -> None:
+        """
+        イベントを記録し、待機中のストリームに通知する
+        
+        Args:
+            event: イベント
+        """
+        self.seq += 1
+        self.events.append({"seq": self.seq, **event})
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    def set_status(self, status: str, error: Optional[str] = None) -> None:
+        """
+        状態を変更し、statusイベントを記録する
+        
+        Args:
+            status: 新しい状態
+            error: エラー内容
+        """
+        self.status = status
+        self.error = error
+        if status == "running":
+            self.started_at = time.time()
+        if status in FINISHED_STATUSES:
+            self.finished_at = time.time()
+        self.record({"type": "status", "status": status, "error": error})
+    
+    def changed(self) -> asyncio.Event:
+        """
+        次にイベントが記録された時にセットされるEventを返す
+        """
+        return self._changed
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        ジョブの状態をAPIの応答用にまとめる
+        """
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "instruction": self.instruction,
+            "steps": self.steps,
+            "skip_confirmation": self.skip_confirmation,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "confirmation_deadline": self.confirmation_deadline,
+            "row_count": self.row_count,
+            "results": self.results,
+            "last_seq": self.seq,
+        }
+
+
+class JobManager:
+    """
+    ジョブの受け付け（アドミッション制御）・ステップ生成・実行を管理する
+    
+    ステップの生成は API_MAX_PLANNING 件まで、実行はブラウザプールの同時実行数までに制限される。
+    未完了のジョブが API_MAX_PENDING_JOBS 件に達している間は新しいジョブを受け付けない。
+    """
+    
+    def __init__(self, agent: AIAgent, pool: BrowserPool):
+        """
+        Args:
+            agent: ステップを生成するAIエージェント
+            pool: ジョブを実行するブラウザプール
+        """
+        self.agent = agent
+        self.pool = pool
+        self.jobs: Dict[str, Job] = {}
+        self._finished: deque = deque()
+        self._planning = asyncio.Semaphore(API_MAX_PLANNING)
+    
+    @property
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.finished)
+    
+    def submit(self, request: JobRequest) -> Job:
+        """
+        ジョブを受け付けて実行を開始する
+        
+        Args:
+            request: 投入リクエスト
+        
+        Returns:
+            受け付けたジョブ
+        
+        Raises:
+            HTTPException: リクエストが不正な場合（400）、受け付け可能なジョブ数を超えている場合（429）
+        """
+        if not request.instruction and not request.steps:
+            raise HTTPException(status_code=400, detail="instruction または steps を指定してください")
+        if self.pending >= API_MAX_PENDING_JOBS:
+            raise HTTPException(status_code=429, detail="受け付け可能なジョブ数を超えています。しばらくしてから再試行してください")
+        
+        job = Job(request)
+        self.jobs[job.id] = job
+        job.record({"type": "status", "status": job.status, "error": None})
+        job.task = asyncio.ensure_future(self._process(job))
+        return job
+    
+    def get(self, job_id: str) -> Job:
+        """
+        ジョブを取得する
+        
+        Raises:
+            HTTPException: ジョブが存在しない場合（404）
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+        return job
+    
+    async def _process(self, job: Job) -> None:
+        """
+        ステップの生成・確認待ち・実行を順に行う
+        
+        Args:
+            job: 対象のジョブ
+        """
+        try:
+            if not job.steps:
+                job.set_status("planning")
+                async with self._planning:
+                    job.steps = await self.agent.generate_steps(job.instruction)
+                if not job.steps:
+                    job.set_status("failed", "有効なステップが生成されませんでした")
+                    return
+                job.record({"type": "plan", "steps": job.steps})
+            
+            if not job.skip_confirmation:
+                # 確認されないジョブが未完了のまま受け付け枠を占有し続けないよう、期限を設ける
+                job.confirmation_deadline = time.time() + API_CONFIRMATION_TIMEOUT
+                job.set_status("awaiting_confirmation")
+                try:
+                    await asyncio.wait_for(job.confirmed.wait(), API_CONFIRMATION_TIMEOUT)
+                except asyncio.TimeoutError:
+                    job.set_status("cancelled", f"実行の確認が{API_CONFIRMATION_TIMEOUT:g}秒以内に行われませんでした")
+                    return
+            
+            job.set_status("running")
+            await self._execute(job)
+            # ステップの例外・ブラウザの障害・エラーになったステップがあれば失敗とする
+            step_error = first_step_error(job.results or [])
+            if step_error:
+                job.set_status("failed", step_error)
+            else:
+                job.set_status("succeeded")
+        except RunCancelledError as e:
+            job.set_status("cancelled" if e.reason == "cancelled" else "failed", str(e))
+        except asyncio.CancelledError:
+            job.set_status("cancelled", job.cancel_token.reason)
+        except Exception as e:
+            job.set_status("failed", str(e))
+        finally:
+            self._retire(job)
+    
+    async def _execute(self, job: Job) -> None:
+        """
+        ジョブのステップを実行し、イベントを記録する（抽出行は rows.jsonl にも書き出す）
+        
+        Args:
+            job: 対象のジョブ
+        """
+        job.artifacts_dir.mkdir(parents=True, exist_ok=True)
+        browser = BrowserAutomation(screenshots_dir=job.artifacts_dir, pool=self.pool, linger_ms=0, thumbnails=False)
+        with open(job.artifacts_dir / "rows.jsonl", "w", encoding="utf-8") as rows_file:
+            async for record in browser.stream_steps(job.steps, cancel_token=job.cancel_token, run_timeout=job.timeout):
+                if record["type"] == "row":
+                    rows_file.write(json.dumps({"step": record["step"], "data": record["data"]}, ensure_ascii=False) + "\n")
+                    job.row_count += 1
+                elif record["type"] == "result":
+                    job.results = record["results"]
+                job.record(record)
+    
+    def cancel(self, job: Job) -> None:
+        """
+        ジョブをキャンセルする（確認待ち・生成中のジョブはタスクごとキャンセルする）
+        
+        Args:
+            job: 対象のジョブ
+        """
+        job.cancel_token.cancel("APIからキャンセルされました")
+        if job.status != "running" and job.task is not None:
+            job.task.cancel()
+    
+    def _retire(self, job: Job) -> None:
+        """
+        完了したジョブを記録し、保持数を超えた古いジョブを成果物のディレクトリとともに削除する
+        
+        Args:
+            job: 完了したジョブ
+        """
+        self._finished.append(job.id)
+        loop = asyncio.get_running_loop()
+        while len(self._finished) > API_MAX_FINISHED_JOBS:
+            evicted = self.jobs.pop(self._finished.popleft(), None)
+            if evicted is not None and evicted.artifacts_dir.exists():
+                # スクリーンショットの削除でイベントループを止めないようスレッドプールで行う
+                loop.run_in_executor(None, shutil.rmtree, evicted.artifacts_dir, True)
+
+
+manager: Optional[JobManager] = None
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    起動時にAIエージェントとブラウザプールを準備し、終了時にブラウザを閉じる
+    """
+    global manager
+    pool = BrowserPool()
+    await pool.start()
+    manager = JobManager(AIAgent(os.environ.get("OPENAI_API_KEY", "your_openai_api_key_here")), pool)
+    try:
+        yield
+    finally:
+        tasks = []
+        for job in list(manager.jobs.values()):
+            if not job.finished:
+                manager.cancel(job)
+                if job.task is not None:
+                    tasks.append(job.task)
+        # 実行中のジョブがコンテキストを閉じ終えてからブラウザを閉じる
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await pool.close()
+
+
+app = FastAPI(title="Web-AI-Agent API", lifespan=lifespan)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest) -> Dict[str, Any]:
+    """
+    ジョブを1件投入する
+    """
+    return manager.submit(request).summary()
+
+
+@app.post("/jobs/bulk", status_code=202)
+async def submit_jobs(request: BulkJobRequest) -> Dict[str, Any]:
+    """
+    複数のジョブを一括投入する（受け付けられなかったジョブはエラーとして返す）
+    """
+    results = []
+    for job_request in request.jobs:
+        try:
+            results.append({"accepted": True, "job": manager.submit(job_request).summary()})
+        except HTTPException as e:
+            results.append({"accepted": False, "status_code": e.status_code, "error": e.detail})
+    return {"accepted": sum(1 for r in results if r["accepted"]), "results": results}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """
+    ジョブの状態を取得する（ポーリング用）
+    """
+    return manager.get(job_id).summary()
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, after: int = 0) -> StreamingResponse:
+    """
+    ジョブのイベントをNDJSON形式でストリーミングする（ジョブが完了するまで接続を維持する）
+    
+    afterに受信済みの最後のseqを指定すると、それより後のイベントから再開できる。
+    """
+    job = manager.get(job_id)
+    
+    async def events():
+        last = after
+        while True:
+            changed = job.changed()
+            for event in list(job.events):
+                if event["seq"] > last:
+                    last = event["seq"]
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            if job.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                # 接続を維持するための空行
+                yield "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/{job_id}/confirm")
+async def confirm_job(job_id: str) -> Dict[str, Any]:
+    """
+    確認待ちのジョブの実行を許可する
+    """
+    job = manager.get(job_id)
+    if job.finished:
+        raise HTTPException(status_code=409, detail=f"ジョブは既に終了しています（{job.status}）")
+    job.confirmed.set()
+    return job.summary()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str) -> Dict[str, Any]:
+    """
+    ジョブをキャンセルする
+    """
+    job = manager.get(job_id)
+    if not job.finished:
+        manager.cancel(job)
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}/artifacts")
+async def list_artifacts(job_id: str) -> Dict[str, Any]:
+    """
+    ジョブの成果物（スクリーンショット、rows.jsonl）の一覧を取得する
+    """
+    job = manager.get(job_id)
+    names = sorted(p.name for p in job.artifacts_dir.iterdir()) if job.artifacts_dir.exists() else []
+    return {"id": job.id, "artifacts": names}
+
+
+@app.get("/jobs/{job_id}/artifacts/{name}")
+async def get_artifact(job_id: str, name: str) -> FileResponse:
+    """
+    ジョブの成果物を取得する
+    """
+    job = manager.get(job_id)
+    path = job.artifacts_dir / name
+    if not re.fullmatch(r"[\w.\-]+", name) or path.resolve().parent != job.artifacts_dir.resolve() or not path.is_file():
+        raise HTTPException(status_code=404, detail="成果物が見つかりません")
+    return FileResponse(path)
+
+
+@app.get("/stats")
+async def get_stats() -> Dict[str, Any]:
+    """
+    ジョブ数・ブラウザプール・定型指示の処理の統計を取得する
+    """
+    counts: Dict[str, int] = {}
+    for job in manager.jobs.values():
+        counts[job.status] = counts.get(job.status, 0) + 1
+    planner = manager.agent.intents.stats() if manager.agent.intents else None
+    return {"jobs": counts, "pending": manager.pending, "pool": await manager.pool.stats(), "planner": planner}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get("API_HOST", "127.0.0.1"), port=int(os.environ.get("API_PORT", "8000")))
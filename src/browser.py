@@ -6,11 +6,235 @@
 """
 
 import os
+import time
 import traceback
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union, Optional, Callable, Awaitable, AsyncIterator
 import asyncio
 from pathlib import Path
-from playwright.async_api import Playwright, async_playwright
+
+from src.pool import BrowserPool
+from src.textinput import KEY_LISTENER_TRACKER_JS, input_text
+
+
+# 抽出アクションの一覧
+EXTRACT_ACTIONS = ("extract_text", "extract_table", "extract_list")
+
+# 1回のevaluateでページから取り出す要素数（大きなリストでもメモリを一定に保つため）
+EXTRACT_BATCH_SIZE = 200
+
+# nextだけが指定され、max_pagesの指定がない抽出で送るページ数の上限
+EXTRACT_DEFAULT_MAX_PAGES = 10
+
+# 出力先（sink）が無い場合に実行結果へ保持する行数の上限
+EXTRACT_MAX_BUFFERED_ROWS = 1000
+
+# 実行ごとに作成するブラウザコンテキストの設定（より人間らしいブラウザとして認識されるための設定）
+CONTEXT_OPTIONS = {
+    "user_agent": 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+    "viewport": {'width': 1280, 'height': 720},
+    "locale": 'ja-JP',
+    "timezone_id": 'Asia/Tokyo',
+    "has_touch": False,
+    "ignore_https_errors": True,
+}
+
+# アクション種別ごとのステップのタイムアウト既定値（ミリ秒）
+STEP_TIMEOUTS = {
+    "open_url": 45000,
+    "click": 20000,
+    "type": 30000,
+    "wait": 15000,
+    "select": 15000,
+    "extract_text": 60000,
+    "extract_list": 120000,
+    "extract_table": 120000,
+    "default": 30000,
+}
+
+# 進捗イベントに添付するサムネイルの設定（縮小率、JPEG品質、最小送信間隔[秒]）
+THUMBNAIL_SCALE = 0.25
+THUMBNAIL_QUALITY = 40
+THUMBNAIL_INTERVAL = float(os.environ.get("BROWSER_THUMBNAIL_INTERVAL", "2.0"))
+
+# extract_text / extract_list 用：要素ごとに1行を生成する
+_EXTRACT_LIST_JS = """
+(els, arg) => {
+    const read = (root, spec) => {
+        let sel = spec, attr = null;
+        const at = spec.lastIndexOf('@');
+        if (at >= 0) { sel = spec.slice(0, at); attr = spec.slice(at + 1); }
+        const el = sel ? root.querySelector(sel) : root;
+        if (!el) return null;
+        return attr ? el.getAttribute(attr) : (el.innerText || el.textContent || '').trim();
+    };
+    const rows = els.slice(arg.offset, arg.offset + arg.batch).map(el => {
+        if (!arg.fields) return {text: read(el, arg.attribute ? '@' + arg.attribute : '')};
+        const row = {};
+        for (const [name, spec] of Object.entries(arg.fields)) row[name] = read(el, spec);
+        return row;
+    });
+    return {rows, more: els.length > arg.offset + arg.batch};
+}
+"""
+
+# extract_table 用：ヘッダ行をキーにしてtrごとに1行を生成する
+_EXTRACT_TABLE_JS = """
+(table, arg) => {
+    const cells = tr => Array.from(tr.querySelectorAll('th, td')).map(c => (c.innerText || c.textContent || '').trim());
+    const trs = Array.from(table.querySelectorAll('tr'));
+    let headRow = table.querySelector('thead tr');
+    if (!headRow && trs.length && trs[0].querySelector('th') && !trs[0].querySelector('td')) headRow = trs[0];
+    const headers = headRow ? cells(headRow) : [];
+    const body = trs.filter(tr => tr !== headRow);
+    const rows = body.slice(arg.offset, arg.offset + arg.batch).map(tr => {
+        const row = {};
+        cells(tr).forEach((v, i) => { row[headers[i] || `col${i + 1}`] = v; });
+        return row;
+    });
+    return {rows, more: body.length > arg.offset + arg.batch};
+}
+"""
+
+
+class RunCancelledError(Exception):
+    """
+    実行がキャンセルされた、または制限時間を超えたことを表す例外
+    """
+    
+    def __init__(self, reason: str, message: str, results: List[Dict[str, Any]]):
+        """
+        Args:
+            reason: 中断理由（"cancelled" または "deadline"）
+            message: 中断理由の説明
+            results: 中断までに完了したステップの実行結果
+        """
+        super().__init__(message)
+        self.reason = reason
+        self.results = results
+
+
+class CancelToken:
+    """
+    呼び出し側から実行中のrun_stepsを中断するためのトークン
+    """
+    
+    def __init__(self):
+        self._event = asyncio.Event()
+        self.reason = "キャンセルされました"
+    
+    def cancel(self, reason: Optional[str] = None) -> None:
+        """
+        実行の中断を要求する
+        
+        Args:
+            reason: 中断理由
+        """
+        if reason:
+            self.reason = reason
+        self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        """
+        中断が要求されているかどうか
+        """
+        return self._event.is_set()
+    
+    async def wait(self) -> None:
+        """
+        中断が要求されるまで待機する
+        """
+        await self._event.wait()
+
+
+def first_step_error(results: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    実行結果から最初にエラーになったステップのエラーを取り出す（parallelステップのブランチも含む）
+    
+    Args:
+        results: run_stepsの実行結果
+    
+    Returns:
+        "ステップ 番号: エラー" 形式の文字列（エラーが無い場合はNone）
+    """
+    for result in results:
+        if result.get("error"):
+            return f"ステップ {result['step']}: {result['error']}"
+        for branch in result.get("branches", []):
+            if branch.get("error"):
+                return f"ステップ {result['step']}（{branch.get('name')}）: {branch['error']}"
+            error = first_step_error(branch.get("results", []))
+            if error:
+                return error
+    return None
+
+
+def has_step_errors(results: List[Dict[str, Any]]) -> bool:
+    """
+    実行結果にエラーになったステップが含まれているか判定する（parallelステップのブランチも含む）
+    
+    Args:
+        results: run_stepsの実行結果
+    
+    Returns:
+        エラーが含まれている場合はTrue
+    """
+    return first_step_error(results) is not None
+
+
+class _Run:
+    """
+    1回のrun_steps呼び出しに紐づく実行状態
+    """
+    
+    def __init__(self, sink: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None, thumbnails: bool = True):
+        """
+        Args:
+            sink: 抽出行などのレコードを受け取る非同期関数（Noneの場合は実行結果に保持する）
+            thumbnails: sinkへサムネイルを送るかどうか
+        """
+        self.sink = sink
+        self.thumbnails = thumbnails
+        # トップレベルのステップの実行結果（中断時も途中までの結果を返せるよう実行中に追記する）
+        self.results: List[Dict[str, Any]] = []
+        # サムネイルの送信時刻と、送信中のタスク
+        self.last_thumbnail = 0.0
+        self.thumbnail_tasks: List[asyncio.Task] = []
+        # ステップの例外やブラウザの障害で実行が途中で止まった場合のエラー
+        self.error: Optional[str] = None
+    
+    def thumbnail_due(self) -> bool:
+        """
+        サムネイルを送るべきか判定する（sinkがあり、前回から THUMBNAIL_INTERVAL 秒以上経過している場合）
+        """
+        if self.sink is None or not self.thumbnails or time.monotonic() - self.last_thumbnail < THUMBNAIL_INTERVAL:
+            return False
+        self.last_thumbnail = time.monotonic()
+        return True
+    
+    async def emit(self, record: Dict[str, Any]) -> None:
+        """
+        レコードをsinkへ送る（sinkが無い場合は何もしない）
+        """
+        if self.sink is not None:
+            await self.sink(record)
+    
+    async def emit_row(self, result: Dict[str, Any], row: Dict[str, Any]) -> None:
+        """
+        抽出した1行を出力する
+        
+        sinkがある場合はそのまま流し、無い場合は上限まで実行結果に保持する。
+        
+        Args:
+            result: 抽出ステップの実行結果
+            row: 抽出した行
+        """
+        if self.sink is not None:
+            await self.sink({"type": "row", "step": result["step"], "data": row})
+        elif len(result["rows"]) < EXTRACT_MAX_BUFFERED_ROWS:
+            result["rows"].append(row)
+        else:
+            result["truncated"] = True
 
 
 class BrowserAutomation:
@@ -18,350 +242,803 @@ class BrowserAutomation:
     Playwrightを使用したブラウザ自動操作クラス
     """
     
-    async def run_steps(self, steps: List[Dict[str, Any]]) -> None:
+    def __init__(self, screenshots_dir: Union[str, Path] = "screenshots",
+                 step_timeouts: Optional[Dict[str, int]] = None,
+                 run_timeout: Optional[int] = None,
+                 pool: Optional[BrowserPool] = None,
+                 linger_ms: int = 5000,
+                 thumbnails: bool = True):
+        """
+        ブラウザ自動操作の初期化
+        
+        Args:
+            screenshots_dir: スクリーンショットの保存先ディレクトリ
+            step_timeouts: アクション種別ごとのステップのタイムアウト（ミリ秒）。指定の無い種別は環境変数または既定値を使用
+            run_timeout: 実行全体の制限時間（ミリ秒）。省略時は環境変数 BROWSER_RUN_TIMEOUT（0以下で無制限）
+            pool: 共有するブラウザプール。省略時は実行ごとにブラウザを起動して終了する
+            linger_ms: 全ステップ完了後、閲覧できるように待機する時間（ミリ秒）
+            thumbnails: 進捗イベントにサムネイルを含めるかどうか（表示しない呼び出し側では無効にして負荷を減らす）
+        """
+        self.screenshots_dir = Path(screenshots_dir)
+        self.step_timeouts = step_timeouts or {}
+        self.run_timeout = run_timeout if run_timeout is not None else int(os.environ.get("BROWSER_RUN_TIMEOUT", "600000"))
+        self.pool = pool
+        self.linger_ms = linger_ms
+        self.thumbnails = thumbnails
+    
+    async def stream_steps(self, steps: List[Dict[str, Any]], max_buffer: int = 100,
+                           cancel_token: Optional[CancelToken] = None,
+                           run_timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        ステップを実行しながら、進捗イベントや抽出行などのレコードを逐次返す非同期ジェネレータ
+        
+        レコードの type は以下のいずれか:
+        - run_started: 実行開始（total: ステップ数）
+        - step_started: ステップ開始（step, action）
+        - step_finished: ステップ完了（step, action, duration_ms, status, error）
+        - thumbnail: 縮小スクリーンショット（step, data: base64エンコードされたJPEG）
+        - row: 抽出された1行（step, data）
+        - error: 実行全体のエラー（message, 中断時は reason: "cancelled" / "deadline"）
+        - run_finished: 実行終了（status: "ok" / "error" / "cancelled" / "deadline", duration_ms）
+          ステップが例外で中止された場合やブラウザの障害が起きた場合は "error"（error: 内容）
+        
+        バッファは max_buffer 件までで、呼び出し側が読み進めない間はブラウザ側の抽出も待機する。
+        最後に {"type": "result", "results": [...]} を返す。
+        呼び出し側が途中で反復を止めた場合は実行をキャンセルする。
+        中断された場合は、残りのレコードを返した後に RunCancelledError を送出する。
+        
+        Args:
+            steps: 実行するUIアクションのステップリスト
+            max_buffer: 未読レコードを保持する最大件数
+            cancel_token: 呼び出し側から実行を中断するためのトークン
+            run_timeout: 実行全体の制限時間（ミリ秒）
+            
+        Yields:
+            {"type": ..., ...} 形式のレコード
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        task = asyncio.ensure_future(self.run_steps(steps, sink=queue.put, cancel_token=cancel_token, run_timeout=run_timeout))
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                break
+            
+            # 実行完了後に残っているレコードを出し切る
+            while not queue.empty():
+                yield queue.get_nowait()
+            yield {"type": "result", "results": task.result()}
+        finally:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            elif not task.cancelled():
+                # 呼び出し側が反復を止めた時点で中断・失敗していた実行の例外は、取得済みにして警告を出さない
+                task.exception()
+    
+    async def run_steps(self, steps: List[Dict[str, Any]],
+                        sink: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                        cancel_token: Optional[CancelToken] = None,
+                        run_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         JSONステップに基づいてブラウザ操作を実行する
         
+        各ステップにはアクション種別ごとのタイムアウトが適用される。実行全体が run_timeout（ミリ秒）を
+        超えた場合や cancel_token がキャンセルされた場合は実行中のステップを中断し、
+        コンテキストとブラウザを閉じてから RunCancelledError を送出する。
+        
         Args:
             steps: 実行するUIアクションのステップリスト
+            sink: 進捗イベントや抽出行などのレコードを受け取る非同期関数（省略時は抽出行を実行結果に保持する）
+            cancel_token: 呼び出し側から実行を中断するためのトークン
+            run_timeout: 実行全体の制限時間（ミリ秒、省略時はインスタンスの設定値、0以下で無制限）
+            
+        Returns:
+            ステップごとの実行結果のリスト（parallelステップはブランチごとの結果を含む）
+            
+        Raises:
+            RunCancelledError: キャンセルされた、または制限時間を超えた場合
+        """
+        run = _Run(sink, self.thumbnails)
+        run_started = time.monotonic()
+        run_timeout = self.run_timeout if run_timeout is None else run_timeout
+        await run.emit({"type": "run_started", "total": len(steps)})
+        
+        body = asyncio.ensure_future(self._run_browser(run, steps))
+        waiters = {body}
+        if cancel_token is not None:
+            waiters.add(asyncio.ensure_future(cancel_token.wait()))
+        
+        try:
+            await asyncio.wait(waiters, timeout=run_timeout / 1000 if run_timeout and run_timeout > 0 else None,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # 呼び出し側がキャンセルされた場合も含め、中断時は必ずブラウザの後始末を待つ
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            if not body.done():
+                try:
+                    await body
+                except asyncio.CancelledError:
+                    pass
+        
+        duration_ms = int((time.monotonic() - run_started) * 1000)
+        if body.cancelled():
+            if cancel_token is not None and cancel_token.cancelled:
+                reason, message = "cancelled", cancel_token.reason
+            else:
+                reason, message = "deadline", f"実行全体の制限時間（{run_timeout} ms）を超えました"
+            print(f"実行を中断しました: {message}")
+            await run.emit({"type": "error", "reason": reason, "message": message})
+            await run.emit({"type": "run_finished", "status": reason, "duration_ms": duration_ms})
+            raise RunCancelledError(reason, message, run.results)
+        
+        if run.error:
+            await run.emit({"type": "run_finished", "status": "error", "error": run.error, "duration_ms": duration_ms})
+        else:
+            await run.emit({"type": "run_finished", "status": "ok", "duration_ms": duration_ms})
+        return body.result()
+    
+    async def _run_browser(self, run: _Run, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        # 環境変数からブラウザ設定を取得
-        headless_str = os.environ.get("BROWSER_HEADLESS", "false").lower()
-        headless = headless_str == "true"
-        slow_mo = int(os.environ.get("BROWSER_SLOW_MO", "0"))
+        プールから借りたコンテキストでステップを実行し、終了時にコンテキストを必ず閉じる
         
+        Args:
+            run: 実行状態
+            steps: 実行するステップリスト
+            
+        Returns:
+            ステップごとの実行結果のリスト
+        """
         # スクリーンショット保存用ディレクトリの作成
-        screenshots_dir = Path("screenshots")
+        screenshots_dir = self.screenshots_dir
         if not screenshots_dir.exists():
-            screenshots_dir.mkdir(exist_ok=True)
+            screenshots_dir.mkdir(parents=True, exist_ok=True)
             print(f"スクリーンショットディレクトリを作成しました: {screenshots_dir}")
         
-        print(f"ブラウザ設定: headless={headless}, slow_mo={slow_mo}")
         print(f"実行するステップ数: {len(steps)}")
-
+        
+        # プールが指定されていない場合は、この実行のためだけにブラウザを起動して終了時に閉じる
+        pool = self.pool or BrowserPool(size=1, monitor_interval=0)
         try:
-            async with async_playwright() as p:
-                # ブラウザを起動（環境変数からheadlessモードを設定）
-                print("ブラウザを起動中...")
-                browser = await p.chromium.launch(headless=headless, slow_mo=slow_mo)
-                # より人間らしいブラウザとして認識されるための設定
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-                    viewport={'width': 1280, 'height': 720},
-                    locale='ja-JP',
-                    timezone_id='Asia/Tokyo',
-                    has_touch=False,
-                    ignore_https_errors=True
-                )
+            # コンテキストはブロックを抜ける際（キャンセル時を含む）にプールが必ず閉じ、枠を解放する
+            async with pool.context(**CONTEXT_OPTIONS) as context:
+                # 個々の操作が既定の30秒を超えて待ち続けないよう、ステップのタイムアウトに合わせる
+                context.set_default_timeout(self._step_timeout({"action": "default"}) * 1000)
+                context.set_default_navigation_timeout(self._step_timeout({"action": "open_url"}) * 1000)
                 
                 # Cookieコンセントや「お使いのPCから普段とは...」ダイアログに対応するためのイベント追加
                 await context.add_init_script("""
                     Object.defineProperty(navigator, 'webdriver', {get: () => false});
                 """)
+                # 入力方法を選ぶため、キーイベントのリスナーを登録した要素を記録する（環境変数 BROWSER_TRACK_KEY_LISTENERS=false で無効）
+                if os.environ.get("BROWSER_TRACK_KEY_LISTENERS", "true").lower() == "true":
+                    await context.add_init_script(KEY_LISTENER_TRACKER_JS)
                 
                 # 自動化を検出するフラグを下げるための設定
                 await context.grant_permissions(['geolocation'])
                 page = await context.new_page()
                 
-                for i, step in enumerate(steps):
-                    action = step.get("action", "")
-                    selector = step.get("selector", "")
-                    value = step.get("value", "")
+                await self._run_sequence(run, context, page, steps, results=run.results)
+                
+                # 全ステップ完了後、閲覧できるように少し待機
+                if run.error:
+                    print(f"エラーにより実行を中止しました。{self.linger_ms / 1000:g}秒後に終了します...")
+                else:
+                    print(f"すべてのステップが完了しました。{self.linger_ms / 1000:g}秒後に終了します...")
+                await page.screenshot(path=str(screenshots_dir / "completion.png"))
+                await page.wait_for_timeout(self.linger_ms)
+                
+        except Exception as e:
+            print(f"UIアクション実行中にエラーが発生しました: {e}")
+            print(traceback.format_exc())
+            # 呼び出し側が実行結果だけで失敗を判定できるよう、実行全体のエラーも結果に残す
+            run.error = run.error or str(e)
+            run.results.append({"step": "run", "action": "run", "screenshots": [], "error": str(e)})
+            await run.emit({"type": "error", "message": str(e)})
+        finally:
+            for task in run.thumbnail_tasks:
+                task.cancel()
+            if pool is not self.pool:
+                await pool.close()
+        
+        return run.results
+    
+    def _step_timeout(self, step: Dict[str, Any]) -> float:
+        """
+        ステップに適用するタイムアウト（秒）を求める
+        
+        優先順位は、ステップの timeout（ミリ秒） > コンストラクタの step_timeouts >
+        環境変数 BROWSER_STEP_TIMEOUT_<ACTION>（ミリ秒） > STEP_TIMEOUTS の既定値。
+        waitアクションは待機時間より短くならないようにする。
+        
+        Args:
+            step: 対象のステップ
+            
+        Returns:
+            タイムアウト（秒）
+        """
+        action = step.get("action", "")
+        if step.get("timeout"):
+            timeout_ms = int(step["timeout"])
+        elif action in self.step_timeouts:
+            timeout_ms = int(self.step_timeouts[action])
+        else:
+            env_value = os.environ.get(f"BROWSER_STEP_TIMEOUT_{action.upper()}")
+            timeout_ms = int(env_value) if env_value else STEP_TIMEOUTS.get(action, STEP_TIMEOUTS["default"])
+        
+        if action == "wait":
+            try:
+                timeout_ms = max(timeout_ms, int(step.get("value", 0)) + 5000)
+            except ValueError:
+                pass
+        return timeout_ms / 1000
+    
+    async def _run_sequence(self, run: _Run, context, page, steps: List[Dict[str, Any]], prefix: str = "",
+                            results: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        ステップのリストを1つのページ上で順番に実行する
+        
+        Args:
+            run: 実行状態
+            context: ブラウザコンテキスト（parallelステップで新しいページを開くために使用）
+            page: ステップを実行するページ
+            steps: 実行するステップリスト
+            prefix: ステップ番号の接頭辞（ブランチ内では "3.1." のようになる）
+            results: 実行結果を追記するリスト（省略時は新しいリストを作成）
+            
+        Returns:
+            ステップごとの実行結果のリスト
+        """
+        if results is None:
+            results = []
+        for i, step in enumerate(steps):
+            label = f"{prefix}{i+1}"
+            action = step.get("action", "")
+            await run.emit({"type": "step_started", "step": label, "action": action})
+            started = time.monotonic()
+            
+            aborted = False
+            try:
+                if action == "parallel":
+                    result = await self._run_parallel(run, context, step, label)
+                else:
+                    timeout = self._step_timeout(step)
+                    try:
+                        result = await asyncio.wait_for(self._execute_step(run, page, step, label, len(steps)), timeout)
+                    except asyncio.TimeoutError:
+                        print(f"ステップ {label} がタイムアウトしました（{int(timeout * 1000)} ms）")
+                        result = {"step": label, "action": action, "screenshots": [],
+                                  "error": f"タイムアウトしました（{int(timeout * 1000)} ms）"}
+                    if run.thumbnail_due():
+                        # サムネイルは実行を待たせないようにバックグラウンドで送る
+                        run.thumbnail_tasks.append(asyncio.ensure_future(self._send_thumbnail(run, page, label)))
+            except Exception as e:
+                # ナビゲーションの失敗やブラウザのクラッシュなど、ステップ内で処理されなかった例外は
+                # 以降のステップを実行できないため、このステップをエラーとして記録してシーケンスを終了する
+                print(f"ステップ {label} でエラーが発生しました: {e}")
+                print(traceback.format_exc())
+                result = {"step": label, "action": action, "screenshots": [], "error": str(e) or type(e).__name__}
+                run.error = run.error or f"ステップ {label}: {result['error']}"
+                aborted = True
+            
+            result["duration_ms"] = int((time.monotonic() - started) * 1000)
+            await run.emit({
+                "type": "step_finished",
+                "step": label,
+                "action": action,
+                "duration_ms": result["duration_ms"],
+                "status": "error" if result.get("error") else "ok",
+                "error": result.get("error"),
+            })
+            results.append(result)
+            if aborted:
+                print(f"ステップ {label} の失敗により、残りの{len(steps) - i - 1}ステップを中止します")
+                break
+        return results
+    
+    async def _run_parallel(self, run: _Run, context, step: Dict[str, Any], label: str) -> Dict[str, Any]:
+        """
+        互いに独立したブランチを同じコンテキスト内の別ページで並行実行する
+        
+        branchesの各要素はステップのリスト、または {"name": ..., "steps": [...]} 形式の辞書。
+        全ブランチが完了するまで待機するため、所要時間は最も遅いブランチの時間になる。
+        
+        Args:
+            run: 実行状態
+            context: ブラウザコンテキスト
+            step: parallelステップ
+            label: ステップ番号
+            
+        Returns:
+            ブランチごとの実行結果をまとめた結果
+        """
+        branches = []
+        for j, branch in enumerate(step.get("branches", [])):
+            if isinstance(branch, dict):
+                branches.append((branch.get("name", f"branch{j+1}"), branch.get("steps", [])))
+            else:
+                branches.append((f"branch{j+1}", branch))
+        
+        print(f"ステップ {label}: {len(branches)}個のブランチを並行実行します")
+        
+        async def run_branch(j: int, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            branch_page = await context.new_page()
+            try:
+                return await self._run_sequence(run, context, branch_page, steps, prefix=f"{label}.{j+1}.")
+            finally:
+                await branch_page.close()
+        
+        outcomes = await asyncio.gather(
+            *[run_branch(j, steps) for j, (_, steps) in enumerate(branches)],
+            return_exceptions=True
+        )
+        
+        result: Dict[str, Any] = {"step": label, "action": "parallel", "branches": [], "screenshots": []}
+        for (name, _), outcome in zip(branches, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"ブランチ '{name}' でエラーが発生しました: {outcome}")
+                result["branches"].append({"name": name, "error": str(outcome), "results": []})
+                continue
+            result["branches"].append({"name": name, "results": outcome})
+            # ブランチ内の成果物（スクリーンショット）を親ステップに集約
+            for branch_result in outcome:
+                result["screenshots"].extend(branch_result.get("screenshots", []))
+        
+        print(f"ステップ {label}: 全ブランチの実行が完了しました")
+        return result
+    
+    async def _extract(self, run: _Run, page, step: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """
+        ページ内でevaluateを実行し、構造化された行を抽出する
+        
+        ページ全体のHTMLは取得せず、EXTRACT_BATCH_SIZE件ずつ取り出してはrunへ流す。
+        nextにセレクタが指定されている場合は、max_pages（指定がない場合は EXTRACT_DEFAULT_MAX_PAGES）まで
+        ページ送りしながら抽出を続ける。
+        
+        Args:
+            run: 実行状態
+            page: 抽出対象のページ
+            step: 抽出ステップ（selector, fields, attribute, next, max_pages, limit）
+            result: 抽出ステップの実行結果（row_count, pagesを記録する）
+        """
+        action = step.get("action", "")
+        selector = step.get("selector", "")
+        next_selector = step.get("next")
+        if step.get("max_pages"):
+            max_pages = int(step["max_pages"])
+        elif next_selector:
+            max_pages = EXTRACT_DEFAULT_MAX_PAGES
+            print(f"max_pagesの指定がないため、最大{max_pages}ページまで抽出します")
+        else:
+            max_pages = 1
+        limit = int(step["limit"]) if step.get("limit") else None
+        arg = {"fields": step.get("fields"), "attribute": step.get("attribute"), "batch": EXTRACT_BATCH_SIZE}
+        
+        count = 0
+        page_no = 0
+        while True:
+            page_no += 1
+            locator = page.locator(selector)
+            if await locator.count() == 0:
+                print(f"警告: セレクタ '{selector}' に一致する要素が見つかりません（{page_no}ページ目）")
+                break
+            
+            offset = 0
+            while limit is None or count < limit:
+                arg["offset"] = offset
+                if action == "extract_table":
+                    chunk = await locator.first.evaluate(_EXTRACT_TABLE_JS, arg)
+                else:
+                    chunk = await locator.evaluate_all(_EXTRACT_LIST_JS, arg)
+                for row in chunk["rows"]:
+                    if limit is not None and count >= limit:
+                        break
+                    count += 1
+                    await run.emit_row(result, row)
+                if not chunk["more"]:
+                    break
+                offset += EXTRACT_BATCH_SIZE
+            
+            if (limit is not None and count >= limit) or not next_selector or page_no >= max_pages:
+                break
+            
+            # 次のページへ
+            next_button = page.locator(next_selector)
+            if await next_button.count() == 0 or not await next_button.first.is_visible():
+                print(f"次ページのリンク '{next_selector}' が見つからないため抽出を終了します")
+                break
+            print(f"次のページへ移動します（{page_no + 1}/{max_pages}）")
+            await next_button.first.click()
+            await page.wait_for_load_state("domcontentloaded")
+            try:
+                await page.wait_for_load_state("networkidle", timeout=5000)
+            except:
+                print("ネットワークアイドル状態になりませんでした")
+        
+        result["row_count"] = count
+        result["pages"] = page_no
+    
+    async def _send_thumbnail(self, run: _Run, page, label: str) -> None:
+        """
+        ページの縮小スクリーンショットを撮り、thumbnailイベントとして送る
+        
+        CDPのPage.captureScreenshotでブラウザ側で縮小・JPEG圧縮するため、転送量は小さい。
+        ページが既に閉じられている場合などの失敗は無視する。
+        
+        Args:
+            run: 実行状態
+            page: 対象のページ
+            label: ステップ番号
+        """
+        try:
+            viewport = page.viewport_size or {"width": 1280, "height": 720}
+            cdp = await page.context.new_cdp_session(page)
+            try:
+                shot = await cdp.send("Page.captureScreenshot", {
+                    "format": "jpeg",
+                    "quality": THUMBNAIL_QUALITY,
+                    "clip": {"x": 0, "y": 0, "width": viewport["width"], "height": viewport["height"], "scale": THUMBNAIL_SCALE},
+                })
+            finally:
+                await cdp.detach()
+            await run.emit({"type": "thumbnail", "step": label, "data": shot["data"]})
+        except Exception as e:
+            print(f"サムネイルの取得に失敗しました: {e}")
+    
+    async def _screenshot(self, target, result: Dict[str, Any], name: str) -> None:
+        """
+        スクリーンショットを保存し、ステップの実行結果に記録する
+        
+        Args:
+            target: スクリーンショットを撮るページまたはロケータ
+            result: ステップの実行結果
+            name: ファイル名
+        """
+        path = str(self.screenshots_dir / name)
+        await target.screenshot(path=path)
+        result["screenshots"].append(path)
+    
+    async def _execute_step(self, run: _Run, page, step: Dict[str, Any], label: str, total: int) -> Dict[str, Any]:
+        """
+        単一のステップを実行する
+        
+        Args:
+            run: 実行状態
+            page: ステップを実行するページ
+            step: 実行するステップ
+            label: ステップ番号
+            total: 同じシーケンス内のステップ数
+            
+        Returns:
+            ステップの実行結果
+        """
+        action = step.get("action", "")
+        selector = step.get("selector", "")
+        value = step.get("value", "")
+        result: Dict[str, Any] = {"step": label, "action": action, "screenshots": []}
+        
+        print(f"ステップ {label}/{total} 実行中: {action} - {selector} - {value}")
+        
+        if action == "open_url":
+            print(f"URLを開きます: {value}")
+            await page.goto(value)
+            print("ページ読み込み完了を待機中...")
+            await page.wait_for_load_state("networkidle")
+            print("ページ読み込み完了")
+            
+            # 現在のURLをログに出力
+            current_url = page.url
+            print(f"現在のURL: {current_url}")
+            
+            # Googleのログイン確認ダイアログの処理
+            if "google.com" in current_url:
+                print("Googleページを検出しました。ログインダイアログの確認中...")
+                
+                # セキュリティチェックメッセージの検出
+                security_messages = [
+                    "お使いのPCから普段とは",
+                    "不審なトラフィックが検出されました",
+                    "ロボットではないことを確認",
+                    "automated query",
+                    "unusual traffic",
+                    "security check"
+                ]
+                
+                # HTMLにセキュリティチェックのメッセージが含まれるか確認
+                content = await page.content()
+                has_security_check = any(msg in content for msg in security_messages)
+                
+                if has_security_check:
+                    print("Google セキュリティチェックを検出しました。操作を中断します。")
+                    print("ヒント: 別の検索エンジン（例：Bing, DuckDuckGo）を使用するか、しばらく時間をおいてから再試行してください。")
+                    await self._screenshot(page, result, f"step_{label}_google_security_check.png")
+                    # 続行はせず、エラーとして表示するだけ
+                    # 必要に応じてここでraiseしてもよい
+                
+                # reCAPTCHA検出と対応
+                try:
+                    print("reCAPTCHAの検出を試みています...")
                     
-                    print(f"ステップ {i+1}/{len(steps)} 実行中: {action} - {selector} - {value}")
+                    # reCAPTCHAのiframeを探す
+                    recaptcha_frame_selectors = [
+                        "iframe[title*='reCAPTCHA']", 
+                        "iframe[src*='recaptcha']", 
+                        "//iframe[contains(@title, 'reCAPTCHA')]"
+                    ]
                     
-                    if action == "open_url":
-                        print(f"URLを開きます: {value}")
-                        await page.goto(value)
-                        print("ページ読み込み完了を待機中...")
-                        await page.wait_for_load_state("networkidle")
-                        print("ページ読み込み完了")
-                        
-                        # 現在のURLをログに出力
-                        current_url = page.url
-                        print(f"現在のURL: {current_url}")
-                        
-                        # Googleのログイン確認ダイアログの処理
-                        if "google.com" in current_url:
-                            print("Googleページを検出しました。ログインダイアログの確認中...")
-                            
-                            # セキュリティチェックメッセージの検出
-                            security_messages = [
-                                "お使いのPCから普段とは",
-                                "不審なトラフィックが検出されました",
-                                "ロボットではないことを確認",
-                                "automated query",
-                                "unusual traffic",
-                                "security check"
-                            ]
+                    for frame_selector in recaptcha_frame_selectors:
+                        frame_count = await page.locator(frame_selector).count()
+                        if frame_count > 0:
+                            print(f"reCAPTCHA iframe検出: {frame_selector}")
                             
-                            # HTMLにセキュリティチェックのメッセージが含まれるか確認
-                            content = await page.content()
-                            has_security_check = any(msg in content for msg in security_messages)
-                            
-                            if has_security_check:
-                                print("Google セキュリティチェックを検出しました。操作を中断します。")
-                                print("ヒント: 別の検索エンジン（例：Bing, DuckDuckGo）を使用するか、しばらく時間をおいてから再試行してください。")
-                                await page.screenshot(path=f"screenshots/google_security_check.png")
-                                # 続行はせず、エラーとして表示するだけ
-                                # 必要に応じてここでraiseしてもよい
-                            
-                            # reCAPTCHA検出と対応
-                            try:
-                                print("reCAPTCHAの検出を試みています...")
-                                
-                                # reCAPTCHAのiframeを探す
-                                recaptcha_frame_selectors = [
-                                    "iframe[title*='reCAPTCHA']", 
-                                    "iframe[src*='recaptcha']", 
-                                    "//iframe[contains(@title, 'reCAPTCHA')]"
+                            # iframeを取得
+                            frame = await page.frame_locator(frame_selector).first
+                            if frame:
+                                # チェックボックスを探す
+                                checkbox_selectors = [
+                                    ".recaptcha-checkbox-border",
+                                    "//span[@role='checkbox']",
+                                    "#recaptcha-anchor"
                                 ]
                                 
-                                for frame_selector in recaptcha_frame_selectors:
-                                    frame_count = await page.locator(frame_selector).count()
-                                    if frame_count > 0:
-                                        print(f"reCAPTCHA iframe検出: {frame_selector}")
-                                        
-                                        # iframeを取得
-                                        frame = await page.frame_locator(frame_selector).first
-                                        if frame:
-                                            # チェックボックスを探す
-                                            checkbox_selectors = [
-                                                ".recaptcha-checkbox-border",
-                                                "//span[@role='checkbox']",
-                                                "#recaptcha-anchor"
-                                            ]
-                                            
-                                            for checkbox in checkbox_selectors:
-                                                try:
-                                                    if await frame.locator(checkbox).is_visible():
-                                                        print(f"reCAPTCHAチェックボックス検出: {checkbox}")
-                                                        await frame.locator(checkbox).click()
-                                                        print("reCAPTCHAチェックボックスをクリックしました")
-                                                        
-                                                        # クリック後に少し待機
-                                                        await page.wait_for_timeout(2000)
-                                                        await page.screenshot(path="screenshots/recaptcha_clicked.png")
-                                                        break
-                                                except Exception as e:
-                                                    print(f"reCAPTCHAクリックエラー: {e}")
-                                
-                                # iframe外でのreCAPTCHA検出
-                                direct_checkbox_selectors = [
-                                    ".recaptcha-checkbox-border", 
-                                    "#recaptcha-anchor",
-                                    "//div[@class='recaptcha-checkbox-border']",
-                                    "//span[@role='checkbox' and contains(@aria-label, 'ロボット')]",
-                                    "//span[@role='checkbox' and contains(@aria-label, 'robot')]"
-                                ]
-                                
-                                for checkbox in direct_checkbox_selectors:
+                                for checkbox in checkbox_selectors:
                                     try:
-                                        checkbox_count = await page.locator(checkbox).count()
-                                        if checkbox_count > 0 and await page.locator(checkbox).is_visible():
-                                            print(f"直接reCAPTCHAチェックボックス検出: {checkbox}")
-                                            await page.click(checkbox)
+                                        if await frame.locator(checkbox).is_visible():
+                                            print(f"reCAPTCHAチェックボックス検出: {checkbox}")
+                                            await frame.locator(checkbox).click()
                                             print("reCAPTCHAチェックボックスをクリックしました")
+                                            
+                                            # クリック後に少し待機
                                             await page.wait_for_timeout(2000)
-                                            await page.screenshot(path="screenshots/recaptcha_direct_clicked.png")
+                                            await self._screenshot(page, result, f"step_{label}_recaptcha_clicked.png")
                                             break
                                     except Exception as e:
-                                        print(f"直接reCAPTCHAクリックエラー: {e}")
-                                
-                            except Exception as e:
-                                print(f"reCAPTCHA処理中のエラー: {e}")
-                                print(traceback.format_exc())
-                            
-                            try:
-                                # 日本語版「ログインしない」または英語版「No thanks」ボタンを探す
-                                login_selectors = [
-                                    "text='ログインしない'", 
-                                    "text='No thanks'", 
-                                    "text='今は設定しない'", 
-                                    "text='Skip'",
-                                    "button:has-text('ログインしない')",
-                                    "button:has-text('No thanks')",
-                                    "button:has-text('今は設定しない')",
-                                    "button:has-text('Skip')",
-                                    "text='同意する'",
-                                    "text='同意して次へ'",
-                                    "text='同意して続行'",
-                                    "text='I agree'",
-                                    "text='Accept'",
-                                    "text='Accept all'",
-                                    "button:has-text('同意する')",
-                                    "button:has-text('同意して次へ')",
-                                    "button:has-text('同意して続行')",
-                                    "button:has-text('I agree')",
-                                    "button:has-text('Accept')",
-                                    "button:has-text('Accept all')"
-                                ]
-                                
-                                for login_selector in login_selectors:
-                                    visible = await page.locator(login_selector).is_visible()
-                                    if visible:
-                                        print(f"ログインダイアログを検出しました。'{login_selector}'をクリックします。")
-                                        await page.click(login_selector)
-                                        print("ログインダイアログをスキップしました")
-                                        await page.wait_for_timeout(1000)  # 安定化のため少し待機
-                                        break
-                            except Exception as e:
-                                print(f"ログインダイアログ処理中のエラー: {e}")
-                        
-                        # スクリーンショット保存
-                        await page.screenshot(path=f"screenshots/step_{i+1}_open_url.png")
+                                        print(f"reCAPTCHAクリックエラー: {e}")
                     
-                    elif action == "click":
-                        print(f"クリック操作: {selector}")
-                        # セレクタの要素が表示されるまで待機
-                        try:
-                            # 要素が存在するか確認
-                            count = await page.locator(selector).count()
-                            print(f"セレクタ '{selector}' に一致する要素数: {count}")
-                            
-                            if count > 0:
-                                # 要素が表示されるまで待機
-                                await page.wait_for_selector(selector, state="visible", timeout=5000)
-                                # 要素のスクリーンショット
-                                try:
-                                    await page.locator(selector).screenshot(path=f"screenshots/step_{i+1}_element.png")
-                                except:
-                                    print("要素のスクリーンショットに失敗しました")
-                                
-                                # クリック実行
-                                await page.click(selector)
-                                print(f"クリック成功: {selector}")
-                                await page.screenshot(path=f"screenshots/step_{i+1}_after_click.png")
-                                
-                                # クリック後にロード状態を待機
-                                try:
-                                    await page.wait_for_load_state("networkidle", timeout=5000)
-                                except:
-                                    print("ネットワークアイドル状態になりませんでした")
-                            else:
-                                print(f"警告: セレクタ '{selector}' に一致する要素が見つかりません")
-                                # 現在のページ内容をログ
-                                content = await page.content()
-                                print(f"ページHTML（一部）: {content[:300]}...")
-                                
-                                # 代替セレクタを試す（特にGoogleの検索ボタンなど）
-                                if "google" in page.url:
-                                    alternative_selectors = [
-                                        "input[name='btnK']",
-                                        "input[value='Google 検索']", 
-                                        "input[aria-label='Google 検索']",
-                                        "input[value='Google Search']",
-                                        "button[aria-label='Google 検索']",
-                                        "button[aria-label='Google Search']"
-                                    ]
-                                    
-                                    print("Googleページで代替セレクタを試します...")
-                                    for alt_selector in alternative_selectors:
-                                        try:
-                                            alt_count = await page.locator(alt_selector).count()
-                                            if alt_count > 0 and await page.locator(alt_selector).is_visible():
-                                                print(f"代替セレクタが見つかりました: {alt_selector}")
-                                                await page.click(alt_selector)
-                                                print(f"代替セレクタでクリック成功: {alt_selector}")
-                                                await page.screenshot(path=f"screenshots/step_{i+1}_alt_click.png")
-                                                break
-                                        except Exception as e:
-                                            print(f"代替セレクタ試行中のエラー: {e}")
-                                
-                                await page.screenshot(path=f"screenshots/step_{i+1}_element_not_found.png")
-                        except Exception as e:
-                            print(f"クリックエラー: {e}")
-                            await page.screenshot(path=f"screenshots/step_{i+1}_click_error.png")
+                    # iframe外でのreCAPTCHA検出
+                    direct_checkbox_selectors = [
+                        ".recaptcha-checkbox-border", 
+                        "#recaptcha-anchor",
+                        "//div[@class='recaptcha-checkbox-border']",
+                        "//span[@role='checkbox' and contains(@aria-label, 'ロボット')]",
+                        "//span[@role='checkbox' and contains(@aria-label, 'robot')]"
+                    ]
                     
-                    elif action == "type":
-                        print(f"入力操作: {selector} に '{value}' を入力")
+                    for checkbox in direct_checkbox_selectors:
                         try:
-                            # GoogleのURLの場合、検索ボックスのセレクタを確認
-                            if "google.com" in page.url and selector in ["input[name='q']", "textarea[name='q']"]:
-                                # 現在のページでセレクタが見つからない場合の代替処理
-                                count = await page.locator(selector).count()
-                                if count == 0:
-                                    alt_selectors = ["textarea[name='q']", "input[name='q']", "[aria-label='検索']", "[aria-label='Search']"]
-                                    for alt_selector in alt_selectors:
-                                        alt_count = await page.locator(alt_selector).count()
-                                        if alt_count > 0:
-                                            print(f"代替検索ボックスセレクタを使用: {alt_selector}")
-                                            selector = alt_selector
-                                            break
-                            
-                            count = await page.locator(selector).count()
-                            print(f"セレクタ '{selector}' に一致する要素数: {count}")
-                            
-                            if count > 0:
-                                # 要素が表示されて入力可能になるまで待機
-                                await page.wait_for_selector(selector, state="visible", timeout=5000)
-                                # フォーカスを当ててから入力
-                                await page.focus(selector)
-                                # テキストをクリアしてから入力
-                                await page.fill(selector, "")
-                                await page.type(selector, value, delay=50)  # 適度な入力速度
-                                print(f"入力成功: {selector}")
-                                
-                                # Enterキーを押す（検索実行などに対応）
-                                if "google.com" in page.url and ("q" in selector or "検索" in selector or "Search" in selector):
-                                    print("Googleの検索ボックスで入力後にEnterキーを押します")
-                                    await page.keyboard.press('Enter')
-                                    await page.wait_for_load_state("networkidle")
-                                
-                                await page.screenshot(path=f"screenshots/step_{i+1}_after_type.png")
-                            else:
-                                print(f"警告: 入力フィールド '{selector}' が見つかりません")
-                                await page.screenshot(path=f"screenshots/step_{i+1}_input_not_found.png")
+                            checkbox_count = await page.locator(checkbox).count()
+                            if checkbox_count > 0 and await page.locator(checkbox).is_visible():
+                                print(f"直接reCAPTCHAチェックボックス検出: {checkbox}")
+                                await page.click(checkbox)
+                                print("reCAPTCHAチェックボックスをクリックしました")
+                                await page.wait_for_timeout(2000)
+                                await self._screenshot(page, result, f"step_{label}_recaptcha_direct_clicked.png")
+                                break
                         except Exception as e:
-                            print(f"入力エラー: {e}")
-                            await page.screenshot(path=f"screenshots/step_{i+1}_type_error.png")
+                            print(f"直接reCAPTCHAクリックエラー: {e}")
                     
-                    elif action == "wait":
-                        # valueが数字（ミリ秒）の場合
-                        try:
-                            wait_time = int(value)
-                            print(f"{wait_time}ミリ秒待機中...")
-                            await page.wait_for_timeout(wait_time)
-                            print("待機完了")
-                            await page.screenshot(path=f"screenshots/step_{i+1}_after_wait.png")
-                        except ValueError:
-                            # valueがセレクタの場合
-                            print(f"セレクタ待機中: {value}")
+                except Exception as e:
+                    print(f"reCAPTCHA処理中のエラー: {e}")
+                    print(traceback.format_exc())
+                
+                try:
+                    # 日本語版「ログインしない」または英語版「No thanks」ボタンを探す
+                    login_selectors = [
+                        "text='ログインしない'", 
+                        "text='No thanks'", 
+                        "text='今は設定しない'", 
+                        "text='Skip'",
+                        "button:has-text('ログインしない')",
+                        "button:has-text('No thanks')",
+                        "button:has-text('今は設定しない')",
+                        "button:has-text('Skip')",
+                        "text='同意する'",
+                        "text='同意して次へ'",
+                        "text='同意して続行'",
+                        "text='I agree'",
+                        "text='Accept'",
+                        "text='Accept all'",
+                        "button:has-text('同意する')",
+                        "button:has-text('同意して次へ')",
+                        "button:has-text('同意して続行')",
+                        "button:has-text('I agree')",
+                        "button:has-text('Accept')",
+                        "button:has-text('Accept all')"
+                    ]
+                    
+                    for login_selector in login_selectors:
+                        visible = await page.locator(login_selector).is_visible()
+                        if visible:
+                            print(f"ログインダイアログを検出しました。'{login_selector}'をクリックします。")
+                            await page.click(login_selector)
+                            print("ログインダイアログをスキップしました")
+                            await page.wait_for_timeout(1000)  # 安定化のため少し待機
+                            break
+                except Exception as e:
+                    print(f"ログインダイアログ処理中のエラー: {e}")
+            
+            # スクリーンショット保存
+            await self._screenshot(page, result, f"step_{label}_open_url.png")
+        
+        elif action == "click":
+            print(f"クリック操作: {selector}")
+            # セレクタの要素が表示されるまで待機
+            try:
+                # 要素が存在するか確認
+                count = await page.locator(selector).count()
+                print(f"セレクタ '{selector}' に一致する要素数: {count}")
+                
+                if count > 0:
+                    # 要素が表示されるまで待機
+                    await page.wait_for_selector(selector, state="visible", timeout=5000)
+                    # 要素のスクリーンショット
+                    try:
+                        await self._screenshot(page.locator(selector), result, f"step_{label}_element.png")
+                    except:
+                        print("要素のスクリーンショットに失敗しました")
+                    
+                    # クリック実行
+                    await page.click(selector)
+                    print(f"クリック成功: {selector}")
+                    await self._screenshot(page, result, f"step_{label}_after_click.png")
+                    
+                    # クリック後にロード状態を待機
+                    try:
+                        await page.wait_for_load_state("networkidle", timeout=5000)
+                    except:
+                        print("ネットワークアイドル状態になりませんでした")
+                else:
+                    print(f"警告: セレクタ '{selector}' に一致する要素が見つかりません")
+                    # 現在のページ内容をログ
+                    content = await page.content()
+                    print(f"ページHTML（一部）: {content[:300]}...")
+                    
+                    # 代替セレクタを試す（特にGoogleの検索ボタンなど）
+                    clicked = False
+                    if "google" in page.url:
+                        alternative_selectors = [
+                            "input[name='btnK']",
+                            "input[value='Google 検索']", 
+                            "input[aria-label='Google 検索']",
+                            "input[value='Google Search']",
+                            "button[aria-label='Google 検索']",
+                            "button[aria-label='Google Search']"
+                        ]
+                        
+                        print("Googleページで代替セレクタを試します...")
+                        for alt_selector in alternative_selectors:
                             try:
-                                await page.wait_for_selector(value, timeout=10000)
-                                print(f"セレクタ出現確認: {value}")
-                                await page.screenshot(path=f"screenshots/step_{i+1}_selector_found.png")
+                                alt_count = await page.locator(alt_selector).count()
+                                if alt_count > 0 and await page.locator(alt_selector).is_visible():
+                                    print(f"代替セレクタが見つかりました: {alt_selector}")
+                                    await page.click(alt_selector)
+                                    print(f"代替セレクタでクリック成功: {alt_selector}")
+                                    await self._screenshot(page, result, f"step_{label}_alt_click.png")
+                                    clicked = True
+                                    break
                             except Exception as e:
-                                print(f"セレクタ待機エラー: {e}")
-                                await page.screenshot(path=f"screenshots/step_{i+1}_wait_error.png")
+                                print(f"代替セレクタ試行中のエラー: {e}")
                     
-                    elif action == "select":
-                        print(f"選択操作: {selector} で {value} を選択")
-                        try:
-                            count = await page.locator(selector).count()
-                            print(f"セレクタ '{selector}' に一致する要素数: {count}")
-                            
-                            if count > 0:
-                                await page.wait_for_selector(selector, state="visible", timeout=5000)
-                                await page.select_option(selector, value)
-                                print(f"選択成功: {selector}")
-                                await page.screenshot(path=f"screenshots/step_{i+1}_after_select.png")
-                            else:
-                                print(f"警告: セレクト要素 '{selector}' が見つかりません")
-                                await page.screenshot(path=f"screenshots/step_{i+1}_select_not_found.png")
-                        except Exception as e:
-                            print(f"選択エラー: {e}")
-                            await page.screenshot(path=f"screenshots/step_{i+1}_select_error.png")
-                    
-                    # アクション実行後の短い待機（操作の安定性向上のため）
-                    print("安定化のため500ms待機")
-                    await page.wait_for_timeout(500)
+                    if not clicked:
+                        result["error"] = f"クリックする要素 '{selector}' が見つかりません"
+                        await self._screenshot(page, result, f"step_{label}_element_not_found.png")
+            except Exception as e:
+                print(f"クリックエラー: {e}")
+                result["error"] = str(e)
+                await self._screenshot(page, result, f"step_{label}_click_error.png")
+        
+        elif action == "type":
+            print(f"入力操作: {selector} に '{value}' を入力")
+            try:
+                # GoogleのURLの場合、検索ボックスのセレクタを確認
+                if "google.com" in page.url and selector in ["input[name='q']", "textarea[name='q']"]:
+                    # 現在のページでセレクタが見つからない場合の代替処理
+                    count = await page.locator(selector).count()
+                    if count == 0:
+                        alt_selectors = ["textarea[name='q']", "input[name='q']", "[aria-label='検索']", "[aria-label='Search']"]
+                        for alt_selector in alt_selectors:
+                            alt_count = await page.locator(alt_selector).count()
+                            if alt_count > 0:
+                                print(f"代替検索ボックスセレクタを使用: {alt_selector}")
+                                selector = alt_selector
+                                break
                 
-                # 全ステップ完了後、閲覧できるように少し待機
-                print("すべてのステップが完了しました。5秒後に終了します...")
-                await page.screenshot(path="screenshots/completion.png")
-                await page.wait_for_timeout(5000)
+                count = await page.locator(selector).count()
+                print(f"セレクタ '{selector}' に一致する要素数: {count}")
                 
-        except Exception as e:
-            print(f"UIアクション実行中にエラーが発生しました: {e}")
-            print(traceback.format_exc())
+                if count > 0:
+                    # 要素が表示されて入力可能になるまで待機
+                    await page.wait_for_selector(selector, state="visible", timeout=5000)
+                    # フィールドに応じた入力方法（fill / insert_text / キー入力）で既存の値を消去して入力
+                    result["input_mode"] = await input_text(page, selector, value, step.get("input_mode"))
+                    print(f"入力成功: {selector}")
+                    
+                    # submitが指定されていればそれに従い、なければGoogleの検索ボックスの場合のみEnterキーを押す
+                    submit = step.get("submit")
+                    if submit is None:
+                        submit = "google.com" in page.url and ("q" in selector or "検索" in selector or "Search" in selector)
+                    if submit:
+                        print("入力後にEnterキーを押して送信します")
+                        await page.keyboard.press('Enter')
+                        await page.wait_for_load_state("networkidle")
+                    
+                    await self._screenshot(page, result, f"step_{label}_after_type.png")
+                else:
+                    print(f"警告: 入力フィールド '{selector}' が見つかりません")
+                    result["error"] = f"入力フィールド '{selector}' が見つかりません"
+                    await self._screenshot(page, result, f"step_{label}_input_not_found.png")
+            except Exception as e:
+                print(f"入力エラー: {e}")
+                result["error"] = str(e)
+                await self._screenshot(page, result, f"step_{label}_type_error.png")
+        
+        elif action == "wait":
+            # valueが数字（ミリ秒）の場合
+            try:
+                wait_time = int(value)
+                print(f"{wait_time}ミリ秒待機中...")
+                await page.wait_for_timeout(wait_time)
+                print("待機完了")
+                await self._screenshot(page, result, f"step_{label}_after_wait.png")
+            except ValueError:
+                # valueがセレクタの場合
+                print(f"セレクタ待機中: {value}")
+                try:
+                    await page.wait_for_selector(value, timeout=10000)
+                    print(f"セレクタ出現確認: {value}")
+                    await self._screenshot(page, result, f"step_{label}_selector_found.png")
+                except Exception as e:
+                    print(f"セレクタ待機エラー: {e}")
+                    result["error"] = str(e)
+                    await self._screenshot(page, result, f"step_{label}_wait_error.png")
+        
+        elif action == "select":
+            print(f"選択操作: {selector} で {value} を選択")
+            try:
+                count = await page.locator(selector).count()
+                print(f"セレクタ '{selector}' に一致する要素数: {count}")
+                
+                if count > 0:
+                    await page.wait_for_selector(selector, state="visible", timeout=5000)
+                    await page.select_option(selector, value)
+                    print(f"選択成功: {selector}")
+                    await self._screenshot(page, result, f"step_{label}_after_select.png")
+                else:
+                    print(f"警告: セレクト要素 '{selector}' が見つかりません")
+                    result["error"] = f"セレクト要素 '{selector}' が見つかりません"
+                    await self._screenshot(page, result, f"step_{label}_select_not_found.png")
+            except Exception as e:
+                print(f"選択エラー: {e}")
+                result["error"] = str(e)
+                await self._screenshot(page, result, f"step_{label}_select_error.png")
+        
+        elif action in EXTRACT_ACTIONS:
+            print(f"抽出操作: {action} - {selector}")
+            result["rows"] = []
+            try:
+                await self._extract(run, page, step, result)
+                print(f"抽出成功: {result['row_count']}行（{result['pages']}ページ）")
+                await self._screenshot(page, result, f"step_{label}_after_extract.png")
+            except Exception as e:
+                print(f"抽出エラー: {e}")
+                result["error"] = str(e)
+                await self._screenshot(page, result, f"step_{label}_extract_error.png")
+        
+        else:
+            print(f"警告: 不明なアクションです: {action}")
+            result["error"] = f"不明なアクションです: {action}"
+        
+        # アクション実行後の短い待機（操作の安定性向上のため）
+        print("安定化のため500ms待機")
+        await page.wait_for_timeout(500)
+        
+        return result
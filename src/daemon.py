@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+常駐デーモンモジュール - AIエージェントと起動済みのブラウザを保持し、Unixソケット経由で指示を受け付ける
+"""
+
+import os
+import json
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, Optional
+
+# 1行に収まるリクエスト・レコードの最大サイズ（サムネイルを含むレコードに対応するため大きめにする）
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class DaemonUnavailableError(Exception):
+    """
+    デーモンに接続できない（起動していない、またはソケットが残っているだけの）場合の例外
+    """
+
+
+class DaemonAlreadyRunningError(Exception):
+    """
+    同じソケットで別のデーモンが既に待ち受けている場合の例外
+    """
+
+
+def default_socket_path() -> str:
+    """
+    デーモンのソケットパスを返す（環境変数 WEB_AI_AGENT_SOCKET、なければユーザーごとの一時ディレクトリ）
+    
+    Returns:
+        ソケットのパス
+    """
+    uid = os.getuid() if hasattr(os, "getuid") else "user"
+    return os.environ.get("WEB_AI_AGENT_SOCKET", str(Path(tempfile.gettempdir()) / f"web-ai-agent-{uid}.sock"))
+
+
+class AgentDaemon:
+    """
+    AIエージェントとブラウザプールを常駐させ、1接続1リクエストのJSONLプロトコルで処理するデーモン
+    
+    リクエストは1行のJSONで、opに応じて以下を行う:
+    - {"op": "plan", "instruction": ...}: ステップを生成して {"type": "plan", "steps": [...]} を返す
+    - {"op": "run", "steps": [...], "timeout": ミリ秒, "thumbnails": false}: ステップを実行し、stream_steps のレコードを1行ずつ返す
+    - {"op": "stats"}: ブラウザプールと定型指示の処理の統計を返す
+    - {"op": "ping"}: 生存確認
+    
+    クライアントが切断した場合は、次のレコードの送信を待たずに実行中のステップをキャンセルする。
+    """
+    
+    def __init__(self, api_key: str, socket_path: Optional[str] = None):
+        """
+        デーモンの初期化
+        
+        Args:
+            api_key: OpenAI APIキー
+            socket_path: 待ち受けるUnixソケットのパス
+        """
+        self.api_key = api_key
+        self.socket_path = socket_path or default_socket_path()
+        self.agent = None
+        self.pool = None
+        # 作成したソケットファイルの (デバイス, inode)（終了時に他のデーモンのソケットを削除しないため）
+        self._socket_id = None
+    
+    async def serve(self) -> None:
+        """
+        エージェントを読み込み、ブラウザを起動してからソケットで待ち受ける（終了するまで戻らない）
+        
+        Raises:
+            DaemonAlreadyRunningError: 同じソケットで別のデーモンが待ち受けている場合
+        """
+        from src.agent import AIAgent
+        from src.pool import BrowserPool
+        
+        # ブラウザを起動する前に、同じソケットのデーモンが動いていないか確認する
+        await self._remove_stale_socket()
+        
+        self.agent = AIAgent(self.api_key)
+        self.pool = BrowserPool()
+        try:
+            await self.pool.warm()
+            await self._remove_stale_socket()
+            # APIキーを持つプロセスに他のユーザーが接続できないよう、作成時から所有者のみに制限する
+            umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=STREAM_LIMIT)
+            finally:
+                os.umask(umask)
+            stat = os.stat(self.socket_path)
+            self._socket_id = (stat.st_dev, stat.st_ino)
+            print(f"デーモンを起動しました: {self.socket_path}")
+            
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.pool.close()
+            self._remove_own_socket()
+    
+    async def _remove_stale_socket(self) -> None:
+        """
+        前回のデーモンが残したソケットファイルを削除する（接続できる場合は稼働中のデーモンのため削除しない）
+        
+        Raises:
+            DaemonAlreadyRunningError: ソケットに接続できた場合
+        """
+        if not os.path.exists(self.socket_path):
+            return
+        try:
+            _, writer = await asyncio.open_unix_connection(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            print(f"残っていたソケットファイルを削除します: {self.socket_path}")
+            os.unlink(self.socket_path)
+            return
+        writer.close()
+        raise DaemonAlreadyRunningError(f"デーモンは既に起動しています: {self.socket_path}")
+    
+    def _remove_own_socket(self) -> None:
+        """
+        このデーモンが作成したソケットファイルを削除する（他のデーモンが作り直したものは残す）
+        """
+        if self._socket_id is None:
+            return
+        try:
+            stat = os.stat(self.socket_path)
+        except FileNotFoundError:
+            return
+        if (stat.st_dev, stat.st_ino) == self._socket_id:
+            os.unlink(self.socket_path)
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        1つの接続からリクエストを読み取り、応答を書き込む
+        
+        Args:
+            reader: 接続の読み取り側
+            writer: 接続の書き込み側
+        """
+        async def send(record: Dict[str, Any]) -> None:
+            writer.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+        
+        try:
+            line = await reader.readline()
+            if not line:
+                # リクエストを送らずに閉じた接続（起動中のデーモンの確認など）
+                return
+            request = json.loads(line)
+            op = request.get("op")
+            
+            if op == "ping":
+                await send({"type": "pong"})
+            elif op == "plan":
+                steps = await self.agent.generate_steps(request.get("instruction", ""))
+                await send({"type": "plan", "steps": steps})
+            elif op == "stats":
+                planner = self.agent.intents.stats() if self.agent.intents else None
+                await send({"type": "stats", "stats": await self.pool.stats(), "planner": planner})
+            elif op == "run":
+                await self._run(request, send, reader)
+            else:
+                await send({"type": "error", "message": f"不明なリクエストです: {op}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            print("クライアントが切断されました")
+        except Exception as e:
+            print(f"リクエスト処理中にエラーが発生しました: {e}")
+            try:
+                await send({"type": "error", "message": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+    
+    async def _run(self, request: Dict[str, Any], send, reader: asyncio.StreamReader) -> None:
+        """
+        ステップを実行し、レコードをクライアントへ逐次送る
+        
+        レコードが出ない長いステップの実行中に切断されても気付けるよう、接続の読み取り側を並行して監視する。
+        
+        Args:
+            request: runリクエスト
+            send: レコードを送る非同期関数
+            reader: 接続の読み取り側（EOFになったらクライアントが切断したとみなす）
+        """
+        from src.browser import BrowserAutomation, CancelToken, RunCancelledError
+        
+        cancel_token = CancelToken()
+        
+        async def watch_disconnect() -> None:
+            try:
+                while await reader.read(4096):
+                    pass
+            except ConnectionError:
+                pass
+            print("クライアントが切断されたため実行をキャンセルします")
+            cancel_token.cancel("クライアントが切断されました")
+        
+        watcher = asyncio.ensure_future(watch_disconnect())
+        browser = BrowserAutomation(pool=self.pool, linger_ms=0, thumbnails=bool(request.get("thumbnails")))
+        records = browser.stream_steps(request.get("steps", []), cancel_token=cancel_token, run_timeout=request.get("timeout"))
+        try:
+            async for record in records:
+                await send(record)
+        except RunCancelledError as e:
+            await send({"type": "cancelled", "reason": e.reason, "message": str(e)})
+        finally:
+            watcher.cancel()
+            # 送信に失敗した（クライアントが切断した）場合は実行をキャンセルしてコンテキストを返却する
+            await records.aclose()
+
+
+async def request(payload: Dict[str, Any], socket_path: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    デーモンにリクエストを送り、応答レコードを逐次返す
+    
+    Args:
+        payload: リクエスト
+        socket_path: デーモンのソケットパス
+    
+    Yields:
+        応答レコード
+    
+    Raises:
+        DaemonUnavailableError: デーモンに接続できない場合
+    """
+    path = socket_path or default_socket_path()
+    try:
+        reader, writer = await asyncio.open_unix_connection(path, limit=STREAM_LIMIT)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise DaemonUnavailableError(
+            f"デーモンに接続できません（{path}）。先に `python run.py --daemon` でデーモンを起動してください"
+        ) from e
+    try:
+        writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            yield json.loads(line)
+    finally:
+        writer.close()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+評価モジュール - プロンプト・モデルの設定ごとにステップ生成の品質とコストを評価する
+
+評価用コーパス（eval/corpus_v*.json）の各指示について、記録済み（またはモック）のLLM応答から
+ステップを生成し、ローカルの評価用サイト（eval/sites）で実行して以下を設定ごとに集計する。
+- パース失敗率、1プランあたりの平均ステップ数・平均トークン数
+- 期待するアクションを含むプランの割合、実行の成功率
+- ステップ生成・実行の平均時間
+- LLMを使わずに定型の指示として処理した割合（設定で fast_path を有効にした場合）
+
+使用例:
+    python -m src.evaluation                      # 記録済みの応答で評価する
+    python -m src.evaluation --no-browser         # ブラウザを起動せずプランのみ評価する
+    python -m src.evaluation --config compact --record   # OpenAI APIを呼び出して応答を記録する
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from functools import partial
+from pathlib import Path
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from typing import List, Dict, Any, Optional
+
+# 評価用データのディレクトリ
+EVAL_DIR = Path(__file__).resolve().parent.parent / "eval"
+
+# コーパスの指示・応答に含まれる、評価用サイトのURLに置き換えるプレースホルダ
+BASE_URL_PLACEHOLDER = "{base_url}"
+
+
+class RecordedClient:
+    """
+    記録済みの応答を返す、AsyncOpenAIと同じ呼び出し方のクライアント
+    
+    応答は指示（評価用サイトのURLをプレースホルダに戻したもの）をキーにして引く。
+    """
+    
+    def __init__(self, responses: Dict[str, Any], base_url: str):
+        """
+        Args:
+            responses: 指示をキーにした {"content": ..., "usage": {...}} の辞書
+            base_url: 評価用サイトのURL
+        """
+        self.responses = responses
+        self.base_url = base_url
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+    
+    async def create(self, messages: List[Dict[str, str]], **kwargs) -> Any:
+        instruction = messages[-1]["content"].replace(self.base_url, BASE_URL_PLACEHOLDER)
+        if instruction not in self.responses:
+            raise KeyError(f"記録済みの応答がありません: {instruction}")
+        recorded = self.responses[instruction]
+        content = recorded["content"].replace(BASE_URL_PLACEHOLDER, self.base_url)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(**recorded.get("usage", {})),
+        )
+
+
+class RecordingClient:
+    """
+    OpenAI APIを呼び出し、応答を記録するクライアント
+    """
+    
+    def __init__(self, client, base_url: str):
+        """
+        Args:
+            client: openai.AsyncOpenAI
+            base_url: 評価用サイトのURL（記録時にプレースホルダに戻す）
+        """
+        self.client = client
+        self.base_url = base_url
+        self.responses: Dict[str, Any] = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+    
+    async def create(self, messages: List[Dict[str, str]], **kwargs) -> Any:
+        response = await self.client.chat.completions.create(messages=messages, **kwargs)
+        instruction = messages[-1]["content"].replace(self.base_url, BASE_URL_PLACEHOLDER)
+        usage = response.usage
+        self.responses[instruction] = {
+            "content": response.choices[0].message.content.replace(self.base_url, BASE_URL_PLACEHOLDER),
+            "usage": {
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else 0,
+            },
+        }
+        return response
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_sites(directory: Path) -> ThreadingHTTPServer:
+    """
+    評価用サイトを空いているポートでバックグラウンド配信する
+    
+    Args:
+        directory: 配信するディレクトリ
+    
+    Returns:
+        起動したサーバー（server_address でポートを取得できる）
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def count_steps(steps: List[Dict[str, Any]]) -> int:
+    """
+    parallelのブランチ内も含めたステップ数を数える
+    """
+    total = 0
+    for step in steps:
+        total += 1
+        for branch in step.get("branches", []):
+            total += count_steps(branch.get("steps", []) if isinstance(branch, dict) else branch)
+    return total
+
+
+def count_rows(results: List[Dict[str, Any]]) -> int:
+    """
+    parallelのブランチ内も含めた抽出行数を数える
+    """
+    total = 0
+    for result in results:
+        total += result.get("row_count", 0)
+        for branch in result.get("branches", []):
+            total += count_rows(branch.get("results", []))
+    return total
+
+
+def matches_actions(steps: List[Dict[str, Any]], expected: List[str]) -> bool:
+    """
+    期待するアクションが順番どおりにプランに含まれているか判定する（間に他のアクションがあってもよい）
+    """
+    actions = iter(step.get("action") for step in steps)
+    return all(any(action == want for action in actions) for want in expected)
+
+
+async def evaluate_config(config: Dict[str, Any], cases: List[Dict[str, Any]], base_url: str,
+                          record: bool = False, pool=None) -> Dict[str, Any]:
+    """
+    1つの設定でコーパス全体を評価する
+    
+    Args:
+        config: {"name", "model", "prompt"（プロンプトファイル）, "responses"（応答ファイル）, "fast_path"（定型指示の処理）}
+        cases: コーパスのケース
+        base_url: 評価用サイトのURL
+        record: OpenAI APIを呼び出して応答を記録する
+        pool: 実行に使うブラウザプール（Noneの場合は実行しない）
+    
+    Returns:
+        設定ごとの集計とケースごとの結果
+    """
+    from src.agent import AIAgent
+    from src.browser import first_step_error
+    
+    system_prompt = (EVAL_DIR / config["prompt"]).read_text(encoding="utf-8") if config.get("prompt") else None
+    responses_path = EVAL_DIR / config["responses"]
+    if record:
+        import openai
+        client = RecordingClient(openai.AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY")), base_url)
+    else:
+        client = RecordedClient(json.loads(responses_path.read_text(encoding="utf-8"))["responses"], base_url)
+    agent = AIAgent("", model=config.get("model"), system_prompt=system_prompt, client=client,
+                    fast_path=bool(config.get("fast_path")))
+    
+    case_results = []
+    for case in cases:
+        instruction = case["instruction"].replace(BASE_URL_PLACEHOLDER, base_url)
+        expect = case.get("expect", {})
+        
+        started = time.perf_counter()
+        steps = await agent.generate_steps(instruction)
+        plan_ms = (time.perf_counter() - started) * 1000
+        
+        outcome = {
+            "id": case["id"],
+            "fast_path": agent.last_usage.get("fast_path", False),
+            "parse_failure": agent.last_usage.get("parse_failure", False) or not steps,
+            "steps": count_steps(steps),
+            "tokens": agent.last_usage.get("prompt_tokens", 0) + agent.last_usage.get("completion_tokens", 0),
+            "plan_match": bool(steps) and matches_actions(steps, expect.get("actions", [])),
+            "plan_ms": round(plan_ms, 1),
+        }
+        
+        if pool is not None and steps:
+            from src.browser import BrowserAutomation, RunCancelledError
+            
+            browser = BrowserAutomation(screenshots_dir=Path(tempfile.gettempdir()) / "web-ai-agent-eval" / config["name"] / case["id"],
+                                        pool=pool, linger_ms=0, thumbnails=False)
+            started = time.perf_counter()
+            try:
+                results = await browser.run_steps(steps)
+                rows = count_rows(results)
+                step_error = first_step_error(results)
+                # expect.error のケースは、実行がエラーとして報告されることを期待する
+                outcome["success"] = (step_error is not None) == expect.get("error", False) and rows >= expect.get("rows_min", 0)
+                outcome["rows"] = rows
+                if step_error:
+                    outcome["error"] = step_error
+            except RunCancelledError as e:
+                outcome["success"] = False
+                outcome["error"] = str(e)
+            outcome["run_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        elif pool is not None:
+            outcome["success"] = False
+        
+        case_results.append(outcome)
+        print(f"[{config['name']}] {case['id']}: {json.dumps(outcome, ensure_ascii=False)}")
+    
+    if record:
+        responses_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"source": "recorded", "model": agent.model, "responses": client.responses}
+        responses_path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"応答を記録しました: {responses_path}")
+    
+    def mean(key: str, rows: List[Dict[str, Any]]) -> Optional[float]:
+        values = [row[key] for row in rows if key in row]
+        return round(sum(values) / len(values), 2) if values else None
+    
+    parsed = [row for row in case_results if not row["parse_failure"]]
+    return {
+        "config": config["name"],
+        "model": agent.model,
+        "cases": len(case_results),
+        "fast_path_rate": mean("fast_path", case_results),
+        "parse_failure_rate": round(1 - len(parsed) / len(case_results), 3) if case_results else None,
+        "mean_steps": mean("steps", parsed),
+        "mean_tokens": mean("tokens", case_results),
+        "plan_match_rate": mean("plan_match", case_results),
+        "success_rate": mean("success", case_results),
+        "mean_plan_ms": mean("plan_ms", case_results),
+        "mean_run_ms": mean("run_ms", case_results),
+        "results": case_results,
+    }
+
+
+def format_report(summaries: List[Dict[str, Any]]) -> str:
+    """
+    設定ごとの集計を表形式の文字列にする
+    """
+    columns = ["config", "model", "fast_path_rate", "parse_failure_rate", "mean_steps", "mean_tokens",
+               "plan_match_rate", "success_rate", "mean_plan_ms", "mean_run_ms"]
+    rows = [[str(summary.get(column) if summary.get(column) is not None else "-") for column in columns] for summary in summaries]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+async def main_async():
+    """
+    コマンドラインから評価を実行する
+    """
+    parser = argparse.ArgumentParser(description='ステップ生成の評価')
+    parser.add_argument('--corpus', default=str(EVAL_DIR / "corpus_v1.json"), help='評価用コーパス')
+    parser.add_argument('--configs', default=str(EVAL_DIR / "configs_v1.json"), help='評価する設定の一覧')
+    parser.add_argument('--config', action='append', help='評価する設定の名前（複数指定可、指定がない場合はすべて）')
+    parser.add_argument('--record', action='store_true', help='OpenAI APIを呼び出して応答を記録する')
+    parser.add_argument('--no-browser', action='store_true', help='ブラウザでの実行を行わず、プランのみ評価する')
+    parser.add_argument('--output', '-o', help='評価結果をJSON形式で書き出すファイル')
+    args = parser.parse_args()
+    
+    if args.record:
+        from src.main import load_env
+        load_env()
+    
+    corpus = json.loads(Path(args.corpus).read_text(encoding="utf-8"))
+    configs = json.loads(Path(args.configs).read_text(encoding="utf-8"))
+    if args.config:
+        configs = [config for config in configs if config["name"] in args.config]
+    print(f"コーパス v{corpus['version']}: {len(corpus['cases'])}件、設定: {', '.join(config['name'] for config in configs)}")
+    
+    server = serve_sites(EVAL_DIR / "sites")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    pool = None
+    if not args.no_browser:
+        from src.pool import BrowserPool
+        pool = BrowserPool(size=1, monitor_interval=0, headless=True)
+    
+    try:
+        summaries = [await evaluate_config(config, corpus["cases"], base_url, args.record, pool) for config in configs]
+    finally:
+        if pool is not None:
+            await pool.close()
+        server.shutdown()
+    
+    print(format_report(summaries))
+    if args.output:
+        report = {"corpus_version": corpus["version"], "summaries": summaries}
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"評価結果を書き出しました: {args.output}")
+
+
+def main():
+    """
+    メイン関数
+    """
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+定型指示モジュール - よくある定型の指示（URLを開く、主要サイトでの検索、フォームへの入力）を
+LLMを使わずにパターンでステップに変換する
+
+指示全体がいずれかのパターンに一致し、その確信度がしきい値以上の場合のみステップを返す。
+それ以外の指示はLLMによる生成に任せる。
+"""
+
+import os
+import re
+from urllib.parse import quote_plus
+from typing import List, Dict, Any, Optional
+
+
+# 定型指示として扱う確信度の下限
+INTENT_MIN_CONFIDENCE = float(os.environ.get("INTENT_MIN_CONFIDENCE", "0.9"))
+
+# 検索に対応するサイトの呼び方と検索結果ページのURL
+SEARCH_SITES = {
+    "google": (("google", "グーグル"), "https://www.google.com/search?q={}"),
+    "bing": (("bing", "ビング"), "https://www.bing.com/search?q={}"),
+    "youtube": (("youtube", "ユーチューブ"), "https://www.youtube.com/results?search_query={}"),
+    "amazon": (("amazon", "アマゾン"), "https://www.amazon.co.jp/s?k={}"),
+}
+
+# スキームも「www.」もないドメインとして扱うトップレベルドメイン
+# （index.html・config.json・settings.py のようなファイル名をURLとして開かないよう、拡張子と紛らわしいものは含めない）
+BARE_DOMAIN_TLDS = ("com", "net", "org", "jp", "io", "dev", "app", "info", "biz", "edu", "gov", "co", "us", "uk", "de", "fr", "kr", "tw", "cn")
+
+_SITE_ALIASES = "|".join(re.escape(alias) for aliases, _ in SEARCH_SITES.values() for alias in aliases)
+_SITE = f"(?P<site>{_SITE_ALIASES})"
+_URL_CHARS = r"[A-Za-z0-9\-._~:/?#\[\]@!$&()*+;=%]"
+_TLD = "(?:" + "|".join(BARE_DOMAIN_TLDS) + ")"
+_URL = (rf"(?P<url>https?://{_URL_CHARS}+"
+        rf"|(?:www\.[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{{2,}}|[a-z0-9-]+(?:\.[a-z0-9-]+)*\.{_TLD})(?![a-z0-9-])(?:/{_URL_CHARS}*)?)")
+_SCHEME_URL = rf"(?P<url>https?://{_URL_CHARS}+)"
+_SELECTOR = r"(?P<selector>[#.\[]\S+?)"
+_OPEN = r"(?:を|に|へ)?\s*(?:開く|開いて(?:ください)?|アクセス(?:する|して(?:ください)?)?|表示(?:する|して(?:ください)?)?|移動(?:する|して(?:ください)?)?)"
+_SEARCH_JA = r"\s*(?:を|で)?\s*検索(?:する|して(?:ください)?)?"
+_SUBMIT_JA = r"(?P<submit>して送信(?:する|して(?:ください)?)?)?"
+_SUBMIT_EN = r"(?P<submit>,?\s*and (?:submit|send)(?: it)?)?"
+# 引用符で囲まれていない検索語（別のサイト名や「and」「then」「、」「を…に」などで続く別の作業・条件を含む指示はLLMに任せる）
+_LOOSE_QUERY_JA = rf"(?P<query>(?:(?!{_SITE_ALIASES}|を)[^「」『』、,])+?)"
+_LOOSE_QUERY_EN = rf"(?P<query>(?:(?!{_SITE_ALIASES}|\band\b|\bthen\b)[^,;「」])+?)"
+
+
+def _quoted(name: str) -> str:
+    """
+    かぎ括弧・引用符で囲まれた文字列に一致するパターンを返す
+    """
+    return rf"(?:「(?P<{name}>[^」]+)」|『(?P<{name}2>[^』]+)』|[\"“](?P<{name}3>[^\"”]+)[\"”]|'(?P<{name}4>[^']+)')"
+
+
+def _group(match: re.Match, name: str) -> Optional[str]:
+    """
+    _quoted で分けた別名のグループも含めて、一致した文字列を返す
+    """
+    for key in (name, f"{name}2", f"{name}3", f"{name}4"):
+        if key in match.groupdict() and match.group(key) is not None:
+            return match.group(key).strip()
+    return None
+
+
+def _normalize_url(url: str) -> str:
+    return url if re.match(r"https?://", url, re.IGNORECASE) else f"https://{url}"
+
+
+def _open_url(match: re.Match) -> List[Dict[str, Any]]:
+    return [{"action": "open_url", "value": _normalize_url(match.group("url"))}]
+
+
+def _search(match: re.Match) -> List[Dict[str, Any]]:
+    alias = match.group("site").lower()
+    site = next(name for name, (aliases, _) in SEARCH_SITES.items() if alias in aliases)
+    query = _group(match, "query")
+    return [{"action": "open_url", "value": SEARCH_SITES[site][1].format(quote_plus(query))}]
+
+
+def _fill(match: re.Match) -> List[Dict[str, Any]]:
+    return [
+        {"action": "open_url", "value": _normalize_url(match.group("url"))},
+        {"action": "type", "selector": match.group("selector"), "value": _group(match, "value"),
+         "submit": bool(match.group("submit"))},
+    ]
+
+
+# (意図の名前, パターン, ステップの生成関数, 確信度)
+# パターンは指示全体に一致する必要がある（前後に別の作業が書かれた指示はLLMに任せる）
+_RULES: List[tuple] = [
+    ("open_url", rf"{_URL}\s*{_OPEN}", _open_url, 1.0),
+    ("open_url", rf"(?:open|go to|visit|navigate to|browse to)\s+{_URL}", _open_url, 1.0),
+    ("open_url", _SCHEME_URL, _open_url, 0.95),
+    ("search", rf"{_SITE}\s*(?:で|にアクセスして、?|を開いて、?)\s*{_quoted('query')}{_SEARCH_JA}", _search, 1.0),
+    ("search", rf"{_quoted('query')}\s*を\s*{_SITE}\s*で\s*検索(?:する|して(?:ください)?)?", _search, 1.0),
+    ("search", rf"{_SITE}\s*で\s*{_LOOSE_QUERY_JA}{_SEARCH_JA}", _search, 0.9),
+    ("search", rf"search (?:for )?{_quoted('query')} (?:on|in) {_SITE}", _search, 1.0),
+    ("search", rf"search {_SITE} for {_quoted('query')}", _search, 1.0),
+    ("search", rf"search (?:for )?{_LOOSE_QUERY_EN} (?:on|in) {_SITE}", _search, 0.9),
+    # 「find」「look up」は商品の比較や絞り込みを伴うことが多いため、しきい値未満としてLLMに任せる
+    ("search", rf"(?:find|look up) {_LOOSE_QUERY_EN} (?:on|in) {_SITE}", _search, 0.8),
+    ("fill", rf"{_URL}\s*(?:を開いて|で)、?\s*{_SELECTOR}\s*に\s*{_quoted('value')}\s*(?:と|を)\s*入力(?:する|して(?:ください)?)?{_SUBMIT_JA}", _fill, 1.0),
+    ("fill", rf"(?:type|enter) {_quoted('value')} (?:into|in) {_SELECTOR} (?:on|at) {_URL}{_SUBMIT_EN}", _fill, 1.0),
+    ("fill", rf"fill (?:in )?{_SELECTOR} with {_quoted('value')} (?:on|at) {_URL}{_SUBMIT_EN}", _fill, 1.0),
+]
+
+
+class IntentMatcher:
+    """
+    定型の指示をパターンでステップに変換し、処理できた割合を集計する
+    """
+    
+    def __init__(self, min_confidence: Optional[float] = None):
+        """
+        Args:
+            min_confidence: 定型指示として扱う確信度の下限（指定がない場合は INTENT_MIN_CONFIDENCE）
+        """
+        self.min_confidence = INTENT_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.rules: List[tuple] = [
+            (name, re.compile(pattern, re.IGNORECASE), build, confidence)
+            for name, pattern, build, confidence in _RULES
+        ]
+        self.requests = 0
+        self.hits: Dict[str, int] = {}
+        self.low_confidence = 0
+    
+    def match(self, instruction: str) -> Optional[Dict[str, Any]]:
+        """
+        指示を定型のステップに変換する
+        
+        Args:
+            instruction: ユーザーからの自然言語指示
+        
+        Returns:
+            {"intent": 意図の名前, "confidence": 確信度, "steps": ステップリスト}（一致しない・確信度が低い場合はNone）
+        """
+        self.requests += 1
+        text = re.sub(r"\s+", " ", instruction).strip().rstrip("。.!！")
+        best: Optional[Dict[str, Any]] = None
+        for name, pattern, build, confidence in self.rules:
+            if best is not None and confidence <= best["confidence"]:
+                continue
+            match = pattern.fullmatch(text)
+            if match:
+                best = {"intent": name, "confidence": confidence, "build": build, "match": match}
+        if best is None:
+            return None
+        if best["confidence"] < self.min_confidence:
+            self.low_confidence += 1
+            return None
+        self.hits[best["intent"]] = self.hits.get(best["intent"], 0) + 1
+        return {"intent": best["intent"], "confidence": best["confidence"], "steps": best["build"](best["match"])}
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        処理した指示の数と、定型指示として処理できた割合を返す
+        """
+        hits = sum(self.hits.values())
+        return {
+            "requests": self.requests,
+            "hits": hits,
+            "hit_rate": round(hits / self.requests, 3) if self.requests else 0.0,
+            "low_confidence": self.low_confidence,
+            "by_intent": dict(self.hits),
+        }
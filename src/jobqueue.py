@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ジョブキューモジュール - 再起動後も失われず、複数のワーカーで分担できる永続ジョブキュー
+
+ワーカーはジョブをリース（期限付きで占有）して実行し、期限内に完了・失敗を報告する。
+リースの期限が切れたジョブは別のワーカーが再取得するため、実行は少なくとも1回（at-least-once）保証される。
+リースは取得のたびに発行されるトークンで識別し、延長・完了・失敗の報告はトークンが一致する場合のみ反映する
+（同じワーカーIDの別の実行枠が再取得した場合も、古いリースの報告は無視される）。
+"""
+
+import abc
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+from functools import partial
+from typing import Dict, Any, Optional
+
+
+class QueuedJob:
+    """
+    キューから取得したジョブ
+    """
+    
+    def __init__(self, row: sqlite3.Row):
+        """
+        Args:
+            row: jobsテーブルの行
+        """
+        self.id = row["id"]
+        self.idempotency_key = row["idempotency_key"]
+        self.payload = json.loads(row["payload"])
+        self.status = row["status"]
+        self.attempts = row["attempts"]
+        self.max_attempts = row["max_attempts"]
+        self.lease_owner = row["lease_owner"]
+        self.lease_token = row["lease_token"]
+        self.lease_expires_at = row["lease_expires_at"]
+        self.result = json.loads(row["result"]) if row["result"] else None
+        self.last_error = row["last_error"]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        ジョブの内容を辞書として返す
+        """
+        return dict(self.__dict__)
+
+
+class JobQueue(abc.ABC):
+    """
+    永続ジョブキューのインターフェース
+    
+    状態は queued（実行待ち）→ leased（実行中）→ succeeded（成功）/ dead（再試行の上限に達した）と遷移する。
+    失敗したジョブは max_attempts に達するまで、バックオフ後に queued へ戻される。
+    """
+    
+    @abc.abstractmethod
+    async def enqueue(self, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                      max_attempts: int = 3, delay: float = 0) -> str:
+        """
+        ジョブを追加する（同じidempotency_keyのジョブが既にある場合は追加せずにそのIDを返す）
+        
+        Args:
+            payload: ジョブの内容（{"steps": [...]} または {"instruction": ...}）
+            idempotency_key: 重複投入を防ぐためのキー
+            max_attempts: 最大試行回数
+            delay: 実行可能になるまでの秒数
+        
+        Returns:
+            ジョブID
+        """
+    
+    @abc.abstractmethod
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        """
+        実行可能なジョブを1件リースする
+        
+        Args:
+            worker_id: ワーカーの識別子
+            lease_seconds: リースの期間（秒）
+        
+        Returns:
+            リースしたジョブ（無い場合はNone）
+        """
+    
+    @abc.abstractmethod
+    async def heartbeat(self, job_id: str, lease_token: str, lease_seconds: float) -> bool:
+        """
+        リースを延長する
+        
+        Args:
+            job_id: ジョブID
+            lease_token: claim で取得したジョブの lease_token
+            lease_seconds: 延長後のリースの期間（秒）
+        
+        Returns:
+            延長できた場合はTrue（期限切れで他のワーカーに取られた場合はFalse）
+        """
+    
+    @abc.abstractmethod
+    async def complete(self, job_id: str, lease_token: str, result: Any) -> bool:
+        """
+        ジョブを成功として完了する
+        
+        Args:
+            job_id: ジョブID
+            lease_token: claim で取得したジョブの lease_token
+            result: 実行結果
+        
+        Returns:
+            完了できた場合はTrue（リースを失っていた場合はFalse）
+        """
+    
+    @abc.abstractmethod
+    async def fail(self, job_id: str, lease_token: str, error: str, retryable: bool = True) -> Optional[str]:
+        """
+        ジョブの失敗を報告する（再試行可能ならバックオフ後に再実行、上限に達したらdeadにする）
+        
+        Args:
+            job_id: ジョブID
+            lease_token: claim で取得したジョブの lease_token
+            error: エラーの内容
+            retryable: 再試行するかどうか
+        
+        Returns:
+            変更後の状態（"queued" または "dead"）。リースを失っていた場合はNone
+        """
+    
+    @abc.abstractmethod
+    async def get(self, job_id: str) -> Optional[QueuedJob]:
+        """
+        ジョブを取得する
+        """
+    
+    @abc.abstractmethod
+    async def retry_dead(self, job_id: str) -> bool:
+        """
+        deadになったジョブを試行回数をリセットして再投入する
+        """
+    
+    @abc.abstractmethod
+    async def stats(self) -> Dict[str, int]:
+        """
+        状態ごとのジョブ数を返す
+        """
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    SQLiteファイルを使ったジョブキュー（1台のホスト専用）
+    
+    同じファイルを共有する複数のワーカープロセスから安全に取得できるよう、
+    リースの取得は BEGIN IMMEDIATE のトランザクション内で行う。
+    WALモードはホスト内の共有メモリを使うため、ネットワークファイルシステム上のファイルを
+    複数のホストから共有することはできない（複数ホストでは別のストアで JobQueue を実装する）。
+    SQLiteの呼び出しはイベントループを止めないようスレッドプールで実行する。
+    """
+    
+    # 再試行までの待機時間（秒）: RETRY_BASE_DELAY × 2^(試行回数-1)、最大 RETRY_MAX_DELAY
+    RETRY_BASE_DELAY = 5.0
+    RETRY_MAX_DELAY = 600.0
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLiteファイルのパス
+        """
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    idempotency_key TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_token TEXT,
+                    lease_expires_at REAL,
+                    result TEXT,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+            """)
+            # リースのトークンが導入される前に作成されたファイルには列を追加する
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "lease_token" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_token TEXT")
+        finally:
+            conn.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """
+        自動コミットモードで接続する（トランザクションは明示的に開始する）
+        """
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+    
+    async def _call(self, func, *args):
+        """
+        SQLiteの処理をスレッドプールで実行する
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self._with_connection, func, *args))
+    
+    def _with_connection(self, func, *args):
+        conn = self._connect()
+        try:
+            return func(conn, *args)
+        finally:
+            conn.close()
+    
+    async def enqueue(self, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                      max_attempts: int = 3, delay: float = 0) -> str:
+        def run(conn: sqlite3.Connection) -> str:
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, idempotency_key, payload, status, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, idempotency_key, json.dumps(payload, ensure_ascii=False), max_attempts, now + delay, now, now)
+            )
+            if idempotency_key is None:
+                return job_id
+            return conn.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()["id"]
+        return await self._call(run)
+    
+    async def claim(self, worker_id: str, lease_seconds: float) -> Optional[QueuedJob]:
+        def run(conn: sqlite3.Connection) -> Optional[QueuedJob]:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # リース切れのまま試行回数の上限に達したジョブは再取得せずdeadにする
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', last_error = COALESCE(last_error, 'リースの期限が切れました'), "
+                    "lease_owner = NULL, lease_token = NULL, updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires_at <= ? AND attempts >= max_attempts",
+                    (now, now)
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                    "OR (status = 'leased' AND lease_expires_at <= ?) ORDER BY available_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_token = ?, lease_expires_at = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, uuid.uuid4().hex, now + lease_seconds, now, row["id"])
+                )
+                job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+                return QueuedJob(job)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return await self._call(run)
+    
+    async def heartbeat(self, job_id: str, lease_token: str, lease_seconds: float) -> bool:
+        def run(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_token = ?",
+                (now + lease_seconds, now, job_id, lease_token)
+            )
+            return cursor.rowcount == 1
+        return await self._call(run)
+    
+    async def complete(self, job_id: str, lease_token: str, result: Any) -> bool:
+        def run(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, lease_owner = NULL, lease_token = NULL, "
+                "lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_token = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, lease_token)
+            )
+            return cursor.rowcount == 1
+        return await self._call(run)
+    
+    async def fail(self, job_id: str, lease_token: str, error: str, retryable: bool = True) -> Optional[str]:
+        def run(conn: sqlite3.Connection) -> Optional[str]:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'leased' AND lease_token = ?",
+                    (job_id, lease_token)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if retryable and row["attempts"] < row["max_attempts"]:
+                    status = "queued"
+                    delay = min(self.RETRY_BASE_DELAY * 2 ** (row["attempts"] - 1), self.RETRY_MAX_DELAY)
+                else:
+                    status, delay = "dead", 0
+                conn.execute(
+                    "UPDATE jobs SET status = ?, available_at = ?, last_error = ?, lease_owner = NULL, "
+                    "lease_token = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                    (status, now + delay, error, now, job_id)
+                )
+                conn.execute("COMMIT")
+                return status
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return await self._call(run)
+    
+    async def get(self, job_id: str) -> Optional[QueuedJob]:
+        def run(conn: sqlite3.Connection) -> Optional[QueuedJob]:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return QueuedJob(row) if row else None
+        return await self._call(run)
+    
+    async def retry_dead(self, job_id: str) -> bool:
+        def run(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'dead'",
+                (now, now, job_id)
+            )
+            return cursor.rowcount == 1
+        return await self._call(run)
+    
+    async def stats(self) -> Dict[str, int]:
+        def run(conn: sqlite3.Connection) -> Dict[str, int]:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+            return {row["status"]: row["count"] for row in rows}
+        return await self._call(run)
@@ -3,58 +3,166 @@
 
 """
 AIエージェント型の画面操作自動化システム - メインエントリーポイント
+
+起動を速くするため、openai・playwright・dotenvは必要になった時点で読み込む。
+（--help では何も読み込まず、--plan-only ではplaywrightを読み込まない）
+抽出結果（JSONL）だけを標準出力に書き出せるよう、進捗のログは標準エラー出力に表示する。
 """
 
 import sys
 import json
 import asyncio
 import argparse
+import contextlib
 import os
-from typing import Optional
+from typing import Optional, List, Dict, Any, AsyncIterator, TextIO, Union
 from pathlib import Path
-from dotenv import load_dotenv
 
-from src.agent import AIAgent
-from src.browser import BrowserAutomation
 
-# .envファイルからの環境変数読み込み
-dotenv_path = Path(__file__).resolve().parent.parent / '.env'
-load_dotenv(dotenv_path)
+def load_env() -> None:
+    """
+    .envファイルから環境変数を読み込む
+    """
+    from dotenv import load_dotenv
+    dotenv_path = Path(__file__).resolve().parent.parent / '.env'
+    load_dotenv(dotenv_path)
 
-# OpenAI APIキーを環境変数から取得
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your_openai_api_key_here")
+
+def get_api_key(api_key: Optional[str] = None) -> str:
+    """
+    OpenAI APIキーを取得する
+    
+    Args:
+        api_key: コマンドライン引数で指定されたAPIキー
+    
+    Returns:
+        APIキー（指定がない場合は環境変数またはデフォルト値）
+    """
+    return api_key or os.environ.get("OPENAI_API_KEY", "your_openai_api_key_here")
 
 
-async def process_instruction(instruction: str, api_key: Optional[str] = None) -> None:
+async def write_rows(records: AsyncIterator[Dict[str, Any]], output: Union[str, TextIO, None] = None) -> None:
+    """
+    実行レコードから抽出された行を取り出し、JSONL形式で逐次書き出す
+    
+    Args:
+        records: stream_steps またはデーモンから受け取るレコード
+        output: 出力先ファイルのパス、または書き出し先のストリーム（指定がない場合は標準出力）
+    """
+    out = open(output, "w", encoding="utf-8") if isinstance(output, str) else output or sys.stdout
+    try:
+        row_count = 0
+        async for record in records:
+            if record["type"] != "row":
+                continue
+            out.write(json.dumps({"step": record["step"], "data": record["data"]}, ensure_ascii=False) + "\n")
+            out.flush()
+            row_count += 1
+        if row_count:
+            print(f"抽出された行数: {row_count}")
+    finally:
+        if isinstance(output, str):
+            out.close()
+
+
+async def generate_steps(instruction: str, api_key: Optional[str] = None, socket_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    指示からステップを生成する（socket_pathが指定された場合はデーモンに依頼する）
+    
+    Args:
+        instruction: ユーザーからの自然言語指示
+        api_key: OpenAI APIキー
+        socket_path: デーモンのソケットパス
+    
+    Returns:
+        ステップリスト
+    """
+    if socket_path:
+        from src import daemon
+        async for record in daemon.request({"op": "plan", "instruction": instruction}, socket_path):
+            if record["type"] == "plan":
+                return record["steps"]
+            print(f"エラー: {record.get('message')}")
+        return []
+    
+    from src.agent import AIAgent
+    agent = AIAgent(get_api_key(api_key))
+    return await agent.generate_steps(instruction)
+
+
+async def execute_steps(steps: List[Dict[str, Any]], output: Union[str, TextIO, None] = None, run_timeout: Optional[int] = None,
+                        socket_path: Optional[str] = None) -> None:
+    """
+    ステップを実行する（socket_pathが指定された場合はデーモンの起動済みブラウザで実行する）
+    
+    Args:
+        steps: 実行するステップリスト
+        output: 抽出結果（JSONL）の出力先ファイル、またはストリーム
+        run_timeout: 実行全体の制限時間（ミリ秒）
+        socket_path: デーモンのソケットパス
+    """
+    if socket_path:
+        from src import daemon
+        
+        async def records() -> AsyncIterator[Dict[str, Any]]:
+            async for record in daemon.request({"op": "run", "steps": steps, "timeout": run_timeout}, socket_path):
+                if record["type"] == "step_finished" and record["status"] == "error":
+                    print(f"ステップ {record['step']} でエラーが発生しました: {record['error']}")
+                elif record["type"] == "cancelled" or (record["type"] == "error" and not record.get("reason")):
+                    print(f"実行を中断しました: {record['message']}")
+                yield record
+        
+        await write_rows(records(), output)
+        return
+    
+    from src.browser import BrowserAutomation, RunCancelledError
+    browser = BrowserAutomation(run_timeout=run_timeout)
+    try:
+        await write_rows(browser.stream_steps(steps), output)
+    except RunCancelledError as e:
+        print(f"実行を中断しました: {e}")
+
+
+async def process_instruction(instruction: str, api_key: Optional[str] = None, output: Union[str, TextIO, None] = None,
+                              run_timeout: Optional[int] = None, plan_only: bool = False, yes: bool = False,
+                              socket_path: Optional[str] = None) -> None:
     """
     ユーザーの指示を処理する
     
     Args:
         instruction: ユーザーからの自然言語指示
         api_key: OpenAI APIキー（指定がない場合は環境変数またはデフォルト値を使用）
+        output: 抽出結果（JSONL）の出力先ファイル、またはストリーム（指定がない場合は標準出力）
+        run_timeout: 実行全体の制限時間（ミリ秒、指定がない場合は環境変数 BROWSER_RUN_TIMEOUT）
+        plan_only: ステップの生成のみ行い、実行しない（ステップのJSONは output に書き出す）
+        yes: 確認せずに実行する
+        socket_path: デーモンのソケットパス（指定した場合はデーモン経由で処理する）
     """
-    # APIキーを設定
-    api_key = api_key or OPENAI_API_KEY
-    
     print(f"指示: {instruction}")
     print("OpenAI APIを使用して操作ステップを生成中...")
     
-    # AIエージェントとブラウザ自動化のインスタンスを作成
-    agent = AIAgent(api_key)
-    browser = BrowserAutomation()
-    
     # 自然言語からJSONステップを生成
-    steps = await agent.generate_steps(instruction)
+    steps = await generate_steps(instruction, api_key, socket_path)
+    
+    if steps and plan_only:
+        # スクリプトから利用できるよう、ログではなく出力先にステップのJSONだけを書き出す
+        plan = json.dumps(steps, indent=2, ensure_ascii=False) + "\n"
+        if isinstance(output, str):
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(plan)
+        else:
+            (output or sys.stdout).write(plan)
+        return
     
     if steps:
         print("生成されたステップ:")
         print(json.dumps(steps, indent=2, ensure_ascii=False))
         
         # 確認プロンプト
-        confirm = input("これらのステップを実行しますか？ (y/n): ")
+        confirm = "y" if yes else input("これらのステップを実行しますか？ (y/n): ")
         if confirm.lower() == 'y':
             print("ステップを実行中...")
-            await browser.run_steps(steps)
+            await execute_steps(steps, output, run_timeout, socket_path)
         else:
             print("実行をキャンセルしました。")
     else:
@@ -68,14 +176,49 @@ async def main_async():
     parser = argparse.ArgumentParser(description='AIエージェント型画面操作自動化システム')
     parser.add_argument('instruction', nargs='?', help='自然言語による指示')
     parser.add_argument('--api-key', help='OpenAI APIキー（指定がない場合は環境変数から取得）')
+    parser.add_argument('--output', '-o', help='抽出結果をJSONL形式で書き出すファイル（指定がない場合は標準出力）')
+    parser.add_argument('--timeout', type=int, help='実行全体の制限時間（ミリ秒、0で無制限。指定がない場合は環境変数 BROWSER_RUN_TIMEOUT）')
+    parser.add_argument('--plan-only', action='store_true', help='ステップの生成のみ行い、ブラウザを起動しない')
+    parser.add_argument('--yes', '-y', action='store_true', help='確認せずに実行する')
+    parser.add_argument('--daemon', action='store_true', help='AIエージェントと起動済みのブラウザを常駐させるデーモンとして起動する')
+    parser.add_argument('--client', action='store_true', help='起動中のデーモンに指示を送って処理する')
+    parser.add_argument('--socket', help='デーモンのUnixソケットのパス（指定がない場合は環境変数 WEB_AI_AGENT_SOCKET または一時ディレクトリ）')
     args = parser.parse_args()
     
+    if args.client:
+        # デーモンがAPIキーとブラウザを保持しているため、クライアントは.envを読み込まない
+        from src.daemon import default_socket_path
+        socket_path = args.socket or default_socket_path()
+    else:
+        load_env()
+        socket_path = None
+    
+    if args.daemon:
+        from src.daemon import AgentDaemon, DaemonAlreadyRunningError
+        try:
+            await AgentDaemon(get_api_key(args.api_key), args.socket).serve()
+        except DaemonAlreadyRunningError as e:
+            print(f"エラー: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
     # コマンドライン引数から指示を取得、なければ入力を促す
     instruction = args.instruction
     if not instruction:
         instruction = input("実行したい操作を自然言語で入力してください: ")
     
-    await process_instruction(instruction, args.api_key)
+    # デーモンモジュールは標準ライブラリのみに依存するため、接続エラーの判定用に読み込んでも起動は遅くならない
+    from src.daemon import DaemonUnavailableError
+    
+    # 行は元の標準出力に書き出し、ログ（printや確認プロンプト）は標準エラー出力に回す
+    output = args.output or sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            await process_instruction(instruction, args.api_key, output, args.timeout,
+                                      plan_only=args.plan_only, yes=args.yes, socket_path=socket_path)
+        except DaemonUnavailableError as e:
+            print(f"エラー: {e}")
+            sys.exit(1)
 
 
 def main():
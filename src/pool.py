@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ブラウザプールモジュール - Chromiumのライフサイクル管理（再利用・リサイクル・リーク検出）を行う
+"""
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+
+def _read_rss_kb(pid: int) -> Optional[int]:
+    """
+    /proc からプロセスの常駐メモリ（VmRSS, KB）を読み取る（Linux以外ではNone）
+    
+    Args:
+        pid: プロセスID
+    
+    Returns:
+        常駐メモリ（KB）
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class PooledBrowser:
+    """
+    プール内の1つのブラウザと、そのコンテキストの貸し出し状況
+    """
+    
+    def __init__(self, browser, index: int):
+        """
+        Args:
+            browser: Playwrightのブラウザ
+            index: プール内での通し番号
+        """
+        self.browser = browser
+        self.id = index
+        self.launched_at = time.time()
+        self.contexts_created = 0
+        # id(context) -> {"context": コンテキスト, "acquired_at": 貸し出し時刻}
+        self.leases: Dict[int, Dict[str, Any]] = {}
+        # 選ばれてからコンテキストの作成が終わるまでの要求数（作成中はブラウザを閉じず、孤立コンテキストとして扱わない）
+        self.pending = 0
+        # リサイクル待ち（新しいコンテキストを作らず、貸し出し中のものが返却されたら閉じる）
+        self.draining = False
+        self.drain_reason: Optional[str] = None
+        self.last_rss_mb: Optional[float] = None
+    
+    def drain(self, reason: str) -> None:
+        """
+        ブラウザをリサイクル待ちにする
+        
+        Args:
+            reason: リサイクルの理由
+        """
+        if not self.draining:
+            print(f"ブラウザ#{self.id}をリサイクルします: {reason}")
+            self.draining = True
+            self.drain_reason = reason
+
+
+class BrowserPool:
+    """
+    複数の実行でChromiumを共有するためのブラウザプール
+    
+    実行ごとに新しいコンテキストを貸し出し、返却時に必ず閉じる。ブラウザは一定数のコンテキストを
+    作成した後、または常駐メモリが閾値を超えた後にリサイクル（貸し出し中のコンテキストの返却を待って
+    終了し、次の要求で新たに起動）される。監視タスクは定期的にメモリを計測し、
+    貸し出されていないのに開いたままのコンテキスト（孤立コンテキスト）を検出して閉じる。
+    """
+    
+    def __init__(self, size: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 max_contexts_per_browser: Optional[int] = None, max_rss_mb: Optional[float] = None,
+                 max_lease_seconds: Optional[float] = None, monitor_interval: float = 30.0,
+                 headless: Optional[bool] = None, slow_mo: Optional[int] = None):
+        """
+        ブラウザプールの初期化（省略した設定は環境変数から取得）
+        
+        Args:
+            size: 同時に起動しておくブラウザ数（BROWSER_POOL_SIZE、デフォルト: 1）
+            max_concurrency: 同時に貸し出すコンテキスト数の上限（BROWSER_POOL_CONCURRENCY、デフォルト: size×4）
+            max_contexts_per_browser: リサイクルまでに1つのブラウザで作成するコンテキスト数（BROWSER_RECYCLE_CONTEXTS、デフォルト: 50）
+            max_rss_mb: リサイクルする常駐メモリの閾値（MB）（BROWSER_RECYCLE_RSS_MB、デフォルト: 2048）
+            max_lease_seconds: これを超えて貸し出されているコンテキストを長期貸し出しとして報告する秒数（デフォルト: 1800）
+            monitor_interval: 監視タスクの実行間隔（秒）
+            headless: ヘッドレスモード（BROWSER_HEADLESS）
+            slow_mo: スローモーション値（ミリ秒）（BROWSER_SLOW_MO）
+        """
+        self.size = size or int(os.environ.get("BROWSER_POOL_SIZE", "1"))
+        self.max_concurrency = max_concurrency or int(os.environ.get("BROWSER_POOL_CONCURRENCY", str(self.size * 4)))
+        self.max_contexts_per_browser = max_contexts_per_browser or int(os.environ.get("BROWSER_RECYCLE_CONTEXTS", "50"))
+        self.max_rss_mb = max_rss_mb or float(os.environ.get("BROWSER_RECYCLE_RSS_MB", "2048"))
+        self.max_lease_seconds = max_lease_seconds or 1800.0
+        self.monitor_interval = monitor_interval
+        self.headless = headless if headless is not None else os.environ.get("BROWSER_HEADLESS", "false").lower() == "true"
+        self.slow_mo = slow_mo if slow_mo is not None else int(os.environ.get("BROWSER_SLOW_MO", "0"))
+        
+        self._playwright = None
+        self._browsers: List[PooledBrowser] = []
+        self._launched = 0
+        self._recycled = 0
+        self._orphans_reaped = 0
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._monitor: Optional[asyncio.Task] = None
+    
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+    
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+    
+    async def start(self) -> None:
+        """
+        Playwrightを起動し、監視タスクを開始する（起動済みの場合は何もしない）
+        """
+        if self._playwright is not None:
+            return
+        # Playwrightの読み込みは重いため、ブラウザが必要になるまで遅らせる
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        if self.monitor_interval > 0:
+            self._monitor = asyncio.ensure_future(self._monitor_loop())
+    
+    async def warm(self) -> None:
+        """
+        最初の実行を待たせないよう、size個のブラウザをあらかじめ起動しておく
+        """
+        await self.start()
+        async with self._lock:
+            while len([b for b in self._browsers if not b.draining]) < self.size:
+                await self._launch()
+    
+    async def close(self) -> None:
+        """
+        監視タスクを止め、すべてのブラウザとPlaywrightを終了する
+        """
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for pooled in self._browsers:
+            try:
+                await pooled.browser.close()
+            except Exception:
+                pass
+        self._browsers = []
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+    
+    @asynccontextmanager
+    async def context(self, **options) -> AsyncIterator[Any]:
+        """
+        新しいブラウザコンテキストを貸し出す
+        
+        ブロックを抜ける際は、例外やキャンセルの場合も含めてコンテキストを閉じ、プールの枠を解放する。
+        
+        Args:
+            options: browser.new_context に渡すオプション
+        
+        Yields:
+            ブラウザコンテキスト
+        """
+        await self.start()
+        await self._slots.acquire()
+        try:
+            pooled = await self._checkout()
+            try:
+                context = await pooled.browser.new_context(**options)
+            except BaseException:
+                pooled.pending -= 1
+                await self._retire_if_drained(pooled)
+                raise
+            pooled.pending -= 1
+            pooled.contexts_created += 1
+            pooled.leases[id(context)] = {"context": context, "acquired_at": time.time()}
+            if pooled.contexts_created >= self.max_contexts_per_browser:
+                pooled.drain(f"作成したコンテキスト数が{self.max_contexts_per_browser}に達しました")
+            try:
+                yield context
+            finally:
+                pooled.leases.pop(id(context), None)
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+                await self._retire_if_drained(pooled)
+        finally:
+            self._slots.release()
+    
+    async def _checkout(self) -> PooledBrowser:
+        """
+        コンテキストを作成するブラウザを選ぶ（足りなければ起動する）
+        
+        選んだブラウザはロックを保持したまま作成中（pending）として数え、コンテキストを作成して
+        貸し出しを登録するまでの間に監視タスクが終了させないようにする。
+        
+        Returns:
+            選ばれたブラウザ
+        """
+        async with self._lock:
+            candidates = [b for b in self._browsers if not b.draining and b.browser.is_connected()]
+            if len(candidates) < self.size:
+                pooled = await self._launch()
+            else:
+                pooled = min(candidates, key=lambda b: len(b.leases) + b.pending)
+            pooled.pending += 1
+            return pooled
+    
+    async def _launch(self) -> PooledBrowser:
+        """
+        ブラウザを起動してプールに加える
+        
+        Returns:
+            起動したブラウザ
+        """
+        print(f"ブラウザ設定: headless={self.headless}, slow_mo={self.slow_mo}")
+        print("ブラウザを起動中...")
+        browser = await self._playwright.chromium.launch(headless=self.headless, slow_mo=self.slow_mo)
+        self._launched += 1
+        pooled = PooledBrowser(browser, self._launched)
+        # クラッシュなどで切断されたブラウザはプールから外す
+        browser.on("disconnected", lambda _: self._forget(pooled))
+        self._browsers.append(pooled)
+        return pooled
+    
+    def _forget(self, pooled: PooledBrowser) -> None:
+        """
+        切断されたブラウザをプールから外す
+        
+        Args:
+            pooled: 対象のブラウザ
+        """
+        if pooled in self._browsers:
+            print(f"ブラウザ#{pooled.id}が切断されました")
+            self._browsers.remove(pooled)
+    
+    async def _retire_if_drained(self, pooled: PooledBrowser) -> None:
+        """
+        リサイクル待ちのブラウザに貸し出し中・作成中のコンテキストが無くなっていれば終了する
+        
+        Args:
+            pooled: 対象のブラウザ
+        """
+        if not pooled.draining or pooled.leases or pooled.pending:
+            return
+        if pooled in self._browsers:
+            self._browsers.remove(pooled)
+            self._recycled += 1
+        try:
+            await pooled.browser.close()
+        except Exception:
+            pass
+    
+    async def _monitor_loop(self) -> None:
+        """
+        定期的にメモリを計測してリサイクル対象を決め、孤立コンテキストを回収する
+        """
+        while True:
+            await asyncio.sleep(self.monitor_interval)
+            try:
+                for pooled in list(self._browsers):
+                    pooled.last_rss_mb = await self.browser_rss_mb(pooled)
+                    if pooled.last_rss_mb is not None and pooled.last_rss_mb > self.max_rss_mb:
+                        pooled.drain(f"常駐メモリが{pooled.last_rss_mb:.0f}MBに達しました")
+                        await self._retire_if_drained(pooled)
+                await self.reap_orphans()
+            except Exception as e:
+                print(f"ブラウザプールの監視中にエラーが発生しました: {e}")
+    
+    async def browser_rss_mb(self, pooled: PooledBrowser) -> Optional[float]:
+        """
+        ブラウザ（ブラウザプロセスとレンダラなどの子プロセス）の常駐メモリの合計を求める
+        
+        CDPのSystemInfo.getProcessInfoでプロセスIDを取得し、/proc から読み取るためLinuxでのみ値が得られる。
+        
+        Args:
+            pooled: 対象のブラウザ
+        
+        Returns:
+            常駐メモリ（MB）。取得できない場合はNone
+        """
+        try:
+            cdp = await pooled.browser.new_browser_cdp_session()
+            try:
+                info = await cdp.send("SystemInfo.getProcessInfo")
+            finally:
+                await cdp.detach()
+        except Exception:
+            return None
+        
+        rss_kb = [_read_rss_kb(proc["id"]) for proc in info.get("processInfo", [])]
+        rss_kb = [kb for kb in rss_kb if kb is not None]
+        return sum(rss_kb) / 1024 if rss_kb else None
+    
+    async def context_memory(self, context) -> Dict[str, float]:
+        """
+        コンテキスト内の全ページのメモリ関連メトリクスをCDPのPerformance.getMetricsで集計する
+        
+        Args:
+            context: 対象のブラウザコンテキスト
+        
+        Returns:
+            {"pages", "js_heap_used_mb", "js_heap_total_mb", "dom_nodes", "documents"}
+        """
+        totals = {"pages": 0, "js_heap_used_mb": 0.0, "js_heap_total_mb": 0.0, "dom_nodes": 0, "documents": 0}
+        for page in context.pages:
+            try:
+                cdp = await context.new_cdp_session(page)
+                try:
+                    await cdp.send("Performance.enable")
+                    metrics = {m["name"]: m["value"] for m in (await cdp.send("Performance.getMetrics"))["metrics"]}
+                finally:
+                    await cdp.detach()
+            except Exception:
+                continue
+            totals["pages"] += 1
+            totals["js_heap_used_mb"] += metrics.get("JSHeapUsedSize", 0) / (1024 * 1024)
+            totals["js_heap_total_mb"] += metrics.get("JSHeapTotalSize", 0) / (1024 * 1024)
+            totals["dom_nodes"] += int(metrics.get("Nodes", 0))
+            totals["documents"] += int(metrics.get("Documents", 0))
+        return totals
+    
+    def detect_orphans(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        リークの疑いがあるコンテキストとページを検出する
+        
+        - orphaned_contexts: プールから貸し出されていないのに開いているコンテキスト
+        - orphaned_pages: 孤立コンテキスト内で開いたままのページ
+        - stale_leases: max_lease_seconds を超えて返却されていないコンテキスト
+        
+        Returns:
+            検出結果
+        """
+        report: Dict[str, List[Dict[str, Any]]] = {"orphaned_contexts": [], "orphaned_pages": [], "stale_leases": []}
+        now = time.time()
+        for pooled in self._browsers:
+            for context in pooled.browser.contexts:
+                # 作成中のコンテキストはまだ貸し出しに登録されていないため、そのブラウザでは判定しない
+                if id(context) in pooled.leases or pooled.pending:
+                    continue
+                report["orphaned_contexts"].append({"browser": pooled.id, "context": context, "pages": len(context.pages)})
+                for page in context.pages:
+                    report["orphaned_pages"].append({"browser": pooled.id, "page": page, "url": page.url})
+            for lease in pooled.leases.values():
+                age = now - lease["acquired_at"]
+                if age > self.max_lease_seconds:
+                    report["stale_leases"].append({"browser": pooled.id, "context": lease["context"], "age_seconds": int(age)})
+        return report
+    
+    async def reap_orphans(self) -> int:
+        """
+        孤立コンテキストを閉じる（長期貸し出しは実行側の制限時間に任せ、報告のみ行う）
+        
+        Returns:
+            閉じたコンテキストの数
+        """
+        report = self.detect_orphans()
+        for stale in report["stale_leases"]:
+            print(f"警告: ブラウザ#{stale['browser']}のコンテキストが{stale['age_seconds']}秒間返却されていません")
+        
+        reaped = 0
+        for orphan in report["orphaned_contexts"]:
+            print(f"孤立コンテキストを閉じます（ブラウザ#{orphan['browser']}、ページ数: {orphan['pages']}）")
+            try:
+                await orphan["context"].close()
+                reaped += 1
+            except Exception:
+                pass
+        self._orphans_reaped += reaped
+        return reaped
+    
+    async def stats(self, include_context_memory: bool = False) -> Dict[str, Any]:
+        """
+        プールとブラウザごとの統計を返す
+        
+        Args:
+            include_context_memory: 貸し出し中のコンテキストごとのメモリメトリクスを含めるかどうか
+        
+        Returns:
+            統計情報
+        """
+        browsers = []
+        for pooled in list(self._browsers):
+            pooled.last_rss_mb = await self.browser_rss_mb(pooled)
+            info = {
+                "id": pooled.id,
+                "uptime_seconds": int(time.time() - pooled.launched_at),
+                "contexts_created": pooled.contexts_created,
+                "active_contexts": len(pooled.leases),
+                "open_contexts": len(pooled.browser.contexts),
+                "open_pages": sum(len(c.pages) for c in pooled.browser.contexts),
+                "rss_mb": round(pooled.last_rss_mb, 1) if pooled.last_rss_mb is not None else None,
+                "draining": pooled.draining,
+                "drain_reason": pooled.drain_reason,
+            }
+            if include_context_memory:
+                info["contexts"] = [await self.context_memory(lease["context"]) for lease in pooled.leases.values()]
+            browsers.append(info)
+        
+        orphans = self.detect_orphans()
+        return {
+            "browsers": browsers,
+            "max_concurrency": self.max_concurrency,
+            "active_contexts": sum(b["active_contexts"] for b in browsers),
+            "launched": self._launched,
+            "recycled": self._recycled,
+            "orphans_reaped": self._orphans_reaped,
+            "orphaned_contexts": len(orphans["orphaned_contexts"]),
+            "orphaned_pages": len(orphans["orphaned_pages"]),
+            "stale_leases": len(orphans["stale_leases"]),
+        }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+テキスト入力モジュール - 入力フィールドごとに最適な入力方法を選んでテキストを入力する
+
+1文字ずつキーイベントを発生させる入力は遅いため、キーイベントを必要とするフィールド
+（オートコンプリートなど）以外では fill や insert_text でまとめて入力する。
+"""
+
+import os
+from typing import Dict, Any, Optional
+
+
+# 入力方法の一覧
+# - fill: 値を直接設定する（inputイベントのみ発生）
+# - insert: フォーカスしてから insert_text で挿入する（貼り付けやIMEの確定と同じ扱い）
+# - keys: 1文字ずつキーイベントを発生させて入力する
+# - hybrid: 大部分を insert_text で挿入し、末尾の数文字だけキーイベントで入力する
+INPUT_MODES = ("fill", "insert", "keys", "hybrid")
+
+# この文字数以上の値は insert_text で挿入する
+INSERT_TEXT_THRESHOLD = int(os.environ.get("BROWSER_INSERT_TEXT_THRESHOLD", "64"))
+
+# キーイベントで入力する際の1文字ごとの待機時間（ミリ秒）
+KEY_DELAY = int(os.environ.get("BROWSER_KEY_DELAY", "20"))
+
+# hybridで末尾からキーイベントで入力する文字数（オートコンプリートの候補表示を発生させるため）
+HYBRID_TAIL_CHARS = 3
+
+# キーイベントのリスナーを登録した要素を記録する（ページの読み込み前に実行する）
+KEY_LISTENER_TRACKER_JS = """
+(() => {
+    const marked = new WeakSet();
+    const keyEvents = new Set(['keydown', 'keypress', 'keyup']);
+    const original = EventTarget.prototype.addEventListener;
+    EventTarget.prototype.addEventListener = function (type, listener, options) {
+        if (keyEvents.has(type) && this instanceof Element) marked.add(this);
+        return original.call(this, type, listener, options);
+    };
+    Object.defineProperty(window, '__webAiAgentHasKeyListener', {
+        value: el => marked.has(el),
+        enumerable: false,
+    });
+    // フォームなど祖先の要素でまとめて受け取る（イベント委譲の）リスナー
+    // body・html・document・windowのリスナーはショートカットキーなどページ全体のものが大半のため数えない
+    Object.defineProperty(window, '__webAiAgentHasDelegatedKeyListener', {
+        value: el => {
+            for (let node = el.parentElement; node && node !== document.body && node !== document.documentElement; node = node.parentElement) {
+                if (marked.has(node)) return true;
+            }
+            return false;
+        },
+        enumerable: false,
+    });
+})();
+"""
+
+# 入力フィールドの種類と、キーイベントを必要とするかどうかを調べる
+_INSPECT_JS = """
+el => {
+    const attr = name => (el.getAttribute(name) || '').toLowerCase();
+    const reasons = [];
+    if (['list', 'both', 'inline'].includes(attr('aria-autocomplete'))) reasons.push('aria-autocomplete');
+    if (attr('role') === 'combobox') reasons.push('combobox');
+    if (el.hasAttribute('list')) reasons.push('datalist');
+    if (el.onkeydown || el.onkeyup || el.onkeypress) reasons.push('onkey');
+    const tracked = window.__webAiAgentHasKeyListener;
+    if (tracked && tracked(el)) reasons.push('key-listener');
+    const delegated = window.__webAiAgentHasDelegatedKeyListener;
+    if (!reasons.length && delegated && delegated(el)) reasons.push('delegated-key-listener');
+    return {
+        tag: el.tagName.toLowerCase(),
+        editable: el.isContentEditable,
+        reasons,
+    };
+}
+"""
+
+
+def choose_input_mode(value: str, info: Dict[str, Any], requested: Optional[str] = None) -> str:
+    """
+    入力方法を決める
+    
+    Args:
+        value: 入力するテキスト
+        info: _INSPECT_JS で調べたフィールドの情報
+        requested: ステップで指定された入力方法（"auto" または未指定の場合は自動で選ぶ）
+    
+    Returns:
+        INPUT_MODES のいずれか
+    """
+    if requested in INPUT_MODES:
+        return requested
+    if info.get("reasons"):
+        return "hybrid" if len(value) > HYBRID_TAIL_CHARS else "keys"
+    if info.get("editable") or len(value) >= INSERT_TEXT_THRESHOLD:
+        return "insert"
+    return "fill"
+
+
+async def input_text(page, selector: str, value: str, requested: Optional[str] = None) -> str:
+    """
+    フィールドの既存の値を消去してからテキストを入力する
+    
+    Args:
+        page: Playwrightのページ
+        selector: 入力フィールドのセレクタ
+        value: 入力するテキスト
+        requested: 入力方法（INPUT_MODES のいずれか、または "auto"）
+    
+    Returns:
+        使用した入力方法
+    """
+    locator = page.locator(selector).first
+    info = await locator.evaluate(_INSPECT_JS)
+    mode = choose_input_mode(value, info, requested)
+    if info["reasons"]:
+        print(f"キーイベントが必要なフィールドです: {', '.join(info['reasons'])}")
+    print(f"入力方法: {mode}（{len(value)}文字）")
+    
+    await locator.fill("")
+    if mode == "fill":
+        await locator.fill(value)
+        return mode
+    
+    await locator.focus()
+    if mode == "keys":
+        await page.keyboard.type(value, delay=KEY_DELAY)
+    elif mode == "insert":
+        await page.keyboard.insert_text(value)
+    else:
+        head, tail = value[:-HYBRID_TAIL_CHARS], value[-HYBRID_TAIL_CHARS:]
+        await page.keyboard.insert_text(head)
+        await page.keyboard.type(tail, delay=KEY_DELAY)
+    return mode
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ワーカーモジュール - 永続ジョブキューからジョブを取得し、BrowserAutomationで実行する
+
+同じキュー（SQLiteファイル）を共有するワーカーを同じホスト上の複数のプロセスで起動することでスケールできる。
+複数のホストで分担する場合は、ホストに依存しないストアで JobQueue を実装したクラスを Worker に渡す。
+
+使用例:
+    python -m src.worker work --db jobs.db --concurrency 2
+    python -m src.worker enqueue --db jobs.db --steps plan.json --key order-123
+    python -m src.worker stats --db jobs.db
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from src.jobqueue import JobQueue, QueuedJob, SQLiteJobQueue
+
+
+class Worker:
+    """
+    ジョブキューからジョブをリースして実行するワーカー
+    
+    実行中はリースの期間の1/3ごとにハートビートでリースを延長する。リースを失った場合
+    （期限切れで他のワーカーに再取得された場合）は実行を中断する。
+    ジョブの例外・制限時間超過・エラーになったステップは失敗として報告し、キューの再試行に任せる。
+    """
+    
+    def __init__(self, queue: JobQueue, pool=None, agent=None, worker_id: Optional[str] = None,
+                 concurrency: int = 1, lease_seconds: float = 60.0, poll_interval: float = 1.0,
+                 artifacts_dir: str = "artifacts"):
+        """
+        Args:
+            queue: ジョブキュー
+            pool: 実行に使うブラウザプール（省略時は起動時に作成する）
+            agent: instructionのみのジョブでステップを生成するAIエージェント
+            worker_id: ワーカーの識別子（省略時は ホスト名:PID）
+            concurrency: 同時に実行するジョブ数
+            lease_seconds: リースの期間（秒）
+            poll_interval: ジョブが無い場合にキューを確認する間隔（秒）
+            artifacts_dir: 成果物（スクリーンショット）の保存先
+        """
+        self.queue = queue
+        self.pool = pool
+        self.agent = agent
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.artifacts_dir = Path(artifacts_dir)
+    
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """
+        stopがセットされるまでジョブを取得して実行する（実行中のジョブは完了を待ってから終了する）
+        
+        Args:
+            stop: 終了を指示するEvent
+        """
+        from src.pool import BrowserPool
+        
+        stop = stop or asyncio.Event()
+        own_pool = self.pool is None
+        if own_pool:
+            self.pool = BrowserPool(max_concurrency=self.concurrency)
+        print(f"ワーカーを起動しました: {self.worker_id}（同時実行数: {self.concurrency}）")
+        try:
+            await asyncio.gather(*[self._loop(stop) for _ in range(self.concurrency)])
+        finally:
+            if own_pool:
+                await self.pool.close()
+        print(f"ワーカーを終了しました: {self.worker_id}")
+    
+    async def _loop(self, stop: asyncio.Event) -> None:
+        """
+        1つの実行枠でジョブの取得と実行を繰り返す
+        """
+        while not stop.is_set():
+            job = await self.queue.claim(self.worker_id, self.lease_seconds)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.process(job)
+    
+    async def process(self, job: QueuedJob) -> None:
+        """
+        リースしたジョブを実行し、結果をキューに報告する
+        
+        Args:
+            job: リースしたジョブ
+        """
+        from src.browser import BrowserAutomation, CancelToken, RunCancelledError, first_step_error
+        
+        print(f"ジョブ {job.id} を実行します（{job.attempts}/{job.max_attempts}回目）")
+        cancel_token = CancelToken()
+        heartbeat = asyncio.ensure_future(self._heartbeat(job, cancel_token))
+        try:
+            steps = job.payload.get("steps")
+            if not steps and job.payload.get("instruction"):
+                if self.agent is None:
+                    raise RuntimeError("instructionのみのジョブを実行するにはAIエージェントが必要です")
+                steps = await self.agent.generate_steps(job.payload["instruction"])
+                if not steps:
+                    # APIの一時的な障害（通信エラー・レート制限）や応答の揺らぎの可能性があるため再試行する
+                    usage = self.agent.last_usage
+                    reason = usage.get("api_error") or usage.get("parse_error") or "有効なステップが生成されませんでした"
+                    status = await self.queue.fail(job.id, job.lease_token, f"ステップの生成に失敗しました: {reason}")
+                    print(f"ジョブ {job.id} のステップ生成に失敗しました（{status}）: {reason}")
+                    return
+            if not steps:
+                await self.queue.fail(job.id, job.lease_token, "実行するステップがありません", retryable=False)
+                return
+            
+            browser = BrowserAutomation(screenshots_dir=self.artifacts_dir / job.id, pool=self.pool,
+                                        linger_ms=0, thumbnails=False)
+            results = await browser.run_steps(steps, cancel_token=cancel_token, run_timeout=job.payload.get("timeout"))
+            step_error = first_step_error(results)
+            if step_error:
+                status = await self.queue.fail(job.id, job.lease_token, step_error)
+                print(f"ジョブ {job.id} は失敗しました（{status}）: {step_error}")
+            elif await self.queue.complete(job.id, job.lease_token, {"steps": steps, "results": results}):
+                print(f"ジョブ {job.id} が完了しました")
+            else:
+                print(f"ジョブ {job.id} のリースを失ったため、結果は破棄されました")
+        except RunCancelledError as e:
+            if cancel_token.cancelled:
+                print(f"ジョブ {job.id} を中断しました: {e}")
+            else:
+                status = await self.queue.fail(job.id, job.lease_token, str(e))
+                print(f"ジョブ {job.id} は失敗しました（{status}）: {e}")
+        except Exception as e:
+            status = await self.queue.fail(job.id, job.lease_token, str(e))
+            print(f"ジョブ {job.id} は失敗しました（{status}）: {e}")
+        finally:
+            heartbeat.cancel()
+    
+    async def _heartbeat(self, job: QueuedJob, cancel_token) -> None:
+        """
+        実行中のジョブのリースを定期的に延長し、失った場合は実行を中断する
+        
+        キューへの問い合わせが失敗した場合は次の間隔で再試行し、リースの期限までに延長できなければ実行を中断する。
+        """
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await self.queue.heartbeat(job.id, job.lease_token, self.lease_seconds):
+                    cancel_token.cancel("ジョブのリースを失いました")
+                    return
+                renewed_at = time.monotonic()
+            except Exception as e:
+                print(f"ジョブ {job.id} のリースの延長に失敗しました: {e}")
+                if time.monotonic() - renewed_at >= self.lease_seconds:
+                    cancel_token.cancel("リースの期限までにリースを延長できませんでした")
+                    return
+
+
+async def main_async():
+    """
+    コマンドラインからワーカーの起動・ジョブの投入・統計の表示を行う
+    """
+    parser = argparse.ArgumentParser(description='Web-AI-Agent ジョブワーカー')
+    parser.add_argument('command', choices=['work', 'enqueue', 'stats', 'retry'], help='実行するコマンド')
+    parser.add_argument('--db', default=os.environ.get("JOB_QUEUE_DB", "jobs.db"), help='ジョブキューのSQLiteファイル（環境変数 JOB_QUEUE_DB）')
+    parser.add_argument('--concurrency', type=int, default=1, help='work: 同時に実行するジョブ数')
+    parser.add_argument('--lease', type=float, default=60.0, help='work: リースの期間（秒）')
+    parser.add_argument('--steps', help='enqueue: ステップ（JSON配列）のファイル')
+    parser.add_argument('--instruction', help='enqueue: 自然言語による指示（ワーカーでステップを生成する）')
+    parser.add_argument('--key', help='enqueue: 重複投入を防ぐためのキー')
+    parser.add_argument('--max-attempts', type=int, default=3, help='enqueue: 最大試行回数')
+    parser.add_argument('--timeout', type=int, help='enqueue: 実行全体の制限時間（ミリ秒）')
+    parser.add_argument('--job', help='retry: 再投入するdeadジョブのID')
+    args = parser.parse_args()
+    
+    queue = SQLiteJobQueue(args.db)
+    
+    if args.command == 'enqueue':
+        payload: Dict[str, Any] = {"timeout": args.timeout}
+        if args.steps:
+            with open(args.steps, encoding="utf-8") as f:
+                payload["steps"] = json.load(f)
+        elif args.instruction:
+            payload["instruction"] = args.instruction
+        else:
+            parser.error("--steps または --instruction を指定してください")
+        print(await queue.enqueue(payload, idempotency_key=args.key, max_attempts=args.max_attempts))
+        return
+    
+    if args.command == 'stats':
+        print(json.dumps(await queue.stats(), ensure_ascii=False))
+        return
+    
+    if args.command == 'retry':
+        print("再投入しました" if await queue.retry_dead(args.job) else "deadのジョブが見つかりません")
+        return
+    
+    from src.main import load_env, get_api_key
+    from src.agent import AIAgent
+    load_env()
+    
+    # SIGTERM / SIGINT で新しいジョブの取得を止め、実行中のジョブの完了を待って終了する
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    
+    worker = Worker(queue, agent=AIAgent(get_api_key()), concurrency=args.concurrency, lease_seconds=args.lease)
+    await worker.run(stop)
+
+
+def main():
+    """
+    メイン関数
+    """
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
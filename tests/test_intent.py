@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+IntentMatcher のテスト（定型として処理する指示と、LLMに任せる指示）
+"""
+
+import pytest
+
+from src.intent import IntentMatcher
+
+
+@pytest.mark.parametrize("instruction, intent, steps", [
+    # URLを開く
+    ("https://example.com を開く", "open_url", [{"action": "open_url", "value": "https://example.com"}]),
+    ("example.comを開いてください。", "open_url", [{"action": "open_url", "value": "https://example.com"}]),
+    ("www.example.shop にアクセスして", "open_url", [{"action": "open_url", "value": "https://www.example.shop"}]),
+    ("example.co.jp/news へ移動する", "open_url", [{"action": "open_url", "value": "https://example.co.jp/news"}]),
+    ("Open github.com/microsoft/playwright", "open_url", [{"action": "open_url", "value": "https://github.com/microsoft/playwright"}]),
+    ("go to https://example.com/a?b=1", "open_url", [{"action": "open_url", "value": "https://example.com/a?b=1"}]),
+    ("http://127.0.0.1:8000/index.html", "open_url", [{"action": "open_url", "value": "http://127.0.0.1:8000/index.html"}]),
+    # 検索
+    ("Googleで「東京 天気」を検索する", "search", [{"action": "open_url", "value": "https://www.google.com/search?q=%E6%9D%B1%E4%BA%AC+%E5%A4%A9%E6%B0%97"}]),
+    ("YouTubeにアクセスして、「猫 かわいい」で検索する", "search", [{"action": "open_url", "value": "https://www.youtube.com/results?search_query=%E7%8C%AB+%E3%81%8B%E3%82%8F%E3%81%84%E3%81%84"}]),
+    ("「ノートパソコン」をアマゾンで検索して", "search", [{"action": "open_url", "value": "https://www.amazon.co.jp/s?k=%E3%83%8E%E3%83%BC%E3%83%88%E3%83%91%E3%82%BD%E3%82%B3%E3%83%B3"}]),
+    ("ビングで天気予報を検索", "search", [{"action": "open_url", "value": "https://www.bing.com/search?q=%E5%A4%A9%E6%B0%97%E4%BA%88%E5%A0%B1"}]),
+    ("search for \"playwright python\" on google", "search", [{"action": "open_url", "value": "https://www.google.com/search?q=playwright+python"}]),
+    ("Search YouTube for 'lofi beats'", "search", [{"action": "open_url", "value": "https://www.youtube.com/results?search_query=lofi+beats"}]),
+    ("search asyncio tutorial on bing", "search", [{"action": "open_url", "value": "https://www.bing.com/search?q=asyncio+tutorial"}]),
+    ("Googleで東京の天気を検索して", "search", [{"action": "open_url", "value": "https://www.google.com/search?q=%E6%9D%B1%E4%BA%AC%E3%81%AE%E5%A4%A9%E6%B0%97"}]),
+    ("search brand new android phones on amazon", "search", [{"action": "open_url", "value": "https://www.amazon.co.jp/s?k=brand+new+android+phones"}]),
+    # フォームへの入力
+    ("https://example.com/search を開いて、#q に「python」と入力して送信する", "fill", [
+        {"action": "open_url", "value": "https://example.com/search"},
+        {"action": "type", "selector": "#q", "value": "python", "submit": True},
+    ]),
+    ("example.com で [name=q] に「猫」を入力", "fill", [
+        {"action": "open_url", "value": "https://example.com"},
+        {"action": "type", "selector": "[name=q]", "value": "猫", "submit": False},
+    ]),
+    ("type 'hello' into #message on example.com and submit", "fill", [
+        {"action": "open_url", "value": "https://example.com"},
+        {"action": "type", "selector": "#message", "value": "hello", "submit": True},
+    ]),
+    ("fill in .name with \"Jane\" at https://example.com/form", "fill", [
+        {"action": "open_url", "value": "https://example.com/form"},
+        {"action": "type", "selector": ".name", "value": "Jane", "submit": False},
+    ]),
+])
+def test_matches(instruction, intent, steps):
+    matched = IntentMatcher().match(instruction)
+    assert matched is not None
+    assert matched["intent"] == intent
+    assert matched["steps"] == steps
+
+
+@pytest.mark.parametrize("instruction", [
+    # ファイル名はURLとして扱わない
+    "index.htmlを開く",
+    "config.jsonを表示して",
+    "open settings.py",
+    "README.md を開いてください",
+    "go to main.ts",
+    # 前後に別の作業がある指示はLLMに任せる
+    "example.comを開いてログインする",
+    "Googleで「東京 天気」を検索して、最初の結果を開く",
+    "open example.com and take a screenshot",
+    # 引用符の無い検索語に、別のサイトでの作業や並べ替えなどの条件が続く指示はLLMに任せる
+    "search for laptops on amazon and compare prices on google",
+    "search for cats on google and dogs on bing",
+    "search for cats on google then dogs on bing",
+    "search for cats, dogs on google",
+    "Amazonでノートパソコンを価格順に検索",
+    "Googleで猫、Bingで犬を検索する",
+    "Googleで猫とYouTubeで犬を検索",
+    # 対応していないサイト・言い回し
+    "Yahooで「天気」を検索する",
+    "find cheap laptops on amazon",
+    "ノートパソコンを価格順に並べて",
+    "",
+])
+def test_does_not_match(instruction):
+    assert IntentMatcher().match(instruction) is None
+
+
+def test_min_confidence():
+    assert IntentMatcher(min_confidence=0.95).match("Googleで天気を検索") is None
+    assert IntentMatcher(min_confidence=0.9).match("Googleで天気を検索") is not None
+    assert IntentMatcher(min_confidence=0.8).match("find cheap laptops on amazon")["intent"] == "search"
+
+
+def test_stats():
+    matcher = IntentMatcher()
+    matcher.match("example.comを開く")
+    matcher.match("index.htmlを開く")
+    matcher.match("find cheap laptops on amazon")
+    matcher.match("search for 'x' on google")
+    assert matcher.stats() == {
+        "requests": 4,
+        "hits": 2,
+        "hit_rate": 0.5,
+        "low_confidence": 1,
+        "by_intent": {"open_url": 1, "search": 1},
+    }
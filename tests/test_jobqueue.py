@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SQLiteJobQueue のテスト（リース・フェンシング・バックオフ・dead・冪等性・複数プロセスでの取得）
+"""
+
+import asyncio
+import sqlite3
+import multiprocessing
+
+import pytest
+
+from src import jobqueue
+from src.jobqueue import JobQueue, SQLiteJobQueue
+
+
+class FakeClock:
+    """
+    jobqueue が参照する time.time を差し替えて、リースの期限やバックオフを待たずに進める
+    """
+    
+    def __init__(self, start: float = 1_000_000.0):
+        self.now = start
+    
+    def time(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(jobqueue.time, "time", fake.time)
+    return fake
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_job_queue_is_abstract():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+
+def test_claim_complete(queue, clock):
+    job_id = run(queue.enqueue({"steps": [{"action": "open_url", "value": "https://example.com"}]}))
+    job = run(queue.claim("w1", 30))
+    assert job.id == job_id
+    assert job.status == "leased"
+    assert job.attempts == 1
+    assert job.lease_owner == "w1"
+    assert job.lease_token
+    assert run(queue.claim("w2", 30)) is None
+    
+    assert run(queue.complete(job_id, job.lease_token, {"rows": 3}))
+    job = run(queue.get(job_id))
+    assert job.status == "succeeded"
+    assert job.result == {"rows": 3}
+    assert job.lease_owner is None
+    assert job.lease_token is None
+
+
+def test_expired_lease_is_reclaimed(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}))
+    first = run(queue.claim("w1", 30))
+    clock.advance(29)
+    assert run(queue.claim("w2", 30)) is None
+    
+    clock.advance(2)
+    job = run(queue.claim("w2", 30))
+    assert job.id == job_id
+    assert job.lease_owner == "w2"
+    assert job.lease_token != first.lease_token
+    assert job.attempts == 2
+
+
+def test_heartbeat_extends_lease(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}))
+    job = run(queue.claim("w1", 30))
+    clock.advance(20)
+    assert run(queue.heartbeat(job_id, job.lease_token, 30))
+    clock.advance(20)
+    assert run(queue.claim("w2", 30)) is None
+    assert not run(queue.heartbeat(job_id, "other-token", 30))
+
+
+@pytest.mark.parametrize("second_worker", ["w2", "w1"])
+def test_stale_lease_is_fenced(queue, clock, second_worker):
+    # 同じワーカーID（同じプロセスの別の実行枠）が再取得した場合も、古いリースは無効になる
+    job_id = run(queue.enqueue({"instruction": "x"}))
+    stale = run(queue.claim("w1", 30))
+    clock.advance(31)
+    current = run(queue.claim(second_worker, 30))
+    assert current.attempts == 2
+    
+    # リースを失った実行の報告は無視される
+    assert not run(queue.heartbeat(job_id, stale.lease_token, 30))
+    assert not run(queue.complete(job_id, stale.lease_token, {"rows": 1}))
+    assert run(queue.fail(job_id, stale.lease_token, "遅れて失敗")) is None
+    job = run(queue.get(job_id))
+    assert job.status == "leased"
+    assert job.lease_token == current.lease_token
+    assert run(queue.claim("w3", 30)) is None
+    
+    assert run(queue.complete(job_id, current.lease_token, {"rows": 2}))
+    assert run(queue.get(job_id)).result == {"rows": 2}
+
+
+def test_fail_backs_off_exponentially(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}, max_attempts=4))
+    expected_delays = [queue.RETRY_BASE_DELAY, queue.RETRY_BASE_DELAY * 2, queue.RETRY_BASE_DELAY * 4]
+    for delay in expected_delays:
+        job = run(queue.claim("w1", 30))
+        assert run(queue.fail(job_id, job.lease_token, "一時的なエラー")) == "queued"
+        job = run(queue.get(job_id))
+        assert job.last_error == "一時的なエラー"
+        clock.advance(delay - 1)
+        assert run(queue.claim("w1", 30)) is None
+        clock.advance(1)
+    assert run(queue.claim("w1", 30)).attempts == 4
+
+
+def test_backoff_is_capped(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}, max_attempts=20))
+    for _ in range(10):
+        job = run(queue.claim("w1", 30))
+        run(queue.fail(job_id, job.lease_token, "一時的なエラー"))
+        clock.advance(queue.RETRY_MAX_DELAY)
+    job = run(queue.claim("w1", 30))
+    run(queue.fail(job_id, job.lease_token, "一時的なエラー"))
+    clock.advance(queue.RETRY_MAX_DELAY - 1)
+    assert run(queue.claim("w1", 30)) is None
+    clock.advance(1)
+    assert run(queue.claim("w1", 30)) is not None
+
+
+def test_dead_after_max_attempts(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}, max_attempts=2))
+    job = run(queue.claim("w1", 30))
+    assert run(queue.fail(job_id, job.lease_token, "失敗1")) == "queued"
+    clock.advance(queue.RETRY_BASE_DELAY)
+    job = run(queue.claim("w1", 30))
+    assert run(queue.fail(job_id, job.lease_token, "失敗2")) == "dead"
+    assert run(queue.get(job_id)).last_error == "失敗2"
+    clock.advance(queue.RETRY_MAX_DELAY)
+    assert run(queue.claim("w1", 30)) is None
+
+
+def test_non_retryable_failure_is_dead(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}, max_attempts=3))
+    job = run(queue.claim("w1", 30))
+    assert run(queue.fail(job_id, job.lease_token, "不正なジョブ", retryable=False)) == "dead"
+
+
+def test_expired_lease_on_last_attempt_is_dead(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}, max_attempts=1))
+    run(queue.claim("w1", 30))
+    clock.advance(31)
+    assert run(queue.claim("w2", 30)) is None
+    job = run(queue.get(job_id))
+    assert job.status == "dead"
+    assert job.last_error == "リースの期限が切れました"
+
+
+def test_retry_dead(queue, clock):
+    job_id = run(queue.enqueue({"instruction": "x"}, max_attempts=1))
+    job = run(queue.claim("w1", 30))
+    run(queue.fail(job_id, job.lease_token, "失敗"))
+    assert run(queue.retry_dead(job_id))
+    assert not run(queue.retry_dead(job_id))
+    job = run(queue.claim("w1", 30))
+    assert job.id == job_id
+    assert job.attempts == 1
+
+
+def test_idempotency_key(queue, clock):
+    first = run(queue.enqueue({"instruction": "a"}, idempotency_key="order-1"))
+    second = run(queue.enqueue({"instruction": "b"}, idempotency_key="order-1"))
+    other = run(queue.enqueue({"instruction": "c"}, idempotency_key="order-2"))
+    assert first == second
+    assert other != first
+    assert run(queue.get(first)).payload == {"instruction": "a"}
+    assert run(queue.stats()) == {"queued": 2}
+
+
+def _claim_all(path: str, worker_id: str, claimed):
+    """
+    キューが空になるまでジョブを取得して完了させる（別プロセスで実行する）
+    """
+    async def loop():
+        queue = SQLiteJobQueue(path)
+        while True:
+            job = await queue.claim(worker_id, 60)
+            if job is None:
+                return
+            claimed.put(job.id)
+            await queue.complete(job.id, job.lease_token, None)
+    asyncio.run(loop())
+
+
+def test_claim_across_processes(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = SQLiteJobQueue(path)
+    job_ids = {run(queue.enqueue({"n": n})) for n in range(40)}
+    
+    claimed = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_claim_all, args=(path, f"w{i}", claimed)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    
+    ids = [claimed.get(timeout=5) for _ in range(len(job_ids))]
+    assert claimed.empty()
+    assert sorted(ids) == sorted(job_ids)
+    assert run(queue.stats()) == {"succeeded": 40}
+
+
+def test_adds_lease_token_to_existing_database(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, payload TEXT NOT NULL, status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, available_at REAL NOT NULL,
+            lease_owner TEXT, lease_expires_at REAL, result TEXT, last_error TEXT,
+            created_at REAL NOT NULL, updated_at REAL NOT NULL
+        );
+    """)
+    conn.close()
+    queue = SQLiteJobQueue(path)
+    job_id = run(queue.enqueue({"instruction": "x"}))
+    job = run(queue.claim("w1", 30))
+    assert run(queue.complete(job_id, job.lease_token, None))
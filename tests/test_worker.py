@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Worker のハートビートのテスト（キューの一時的な障害とリースの喪失）
+"""
+
+import asyncio
+
+from src.browser import CancelToken
+from src.worker import Worker
+
+
+class FlakyQueue:
+    """
+    heartbeat が指定した結果（例外を含む）を順に返すキュー
+    """
+    
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+    
+    async def heartbeat(self, job_id, lease_token, lease_seconds):
+        self.calls.append((job_id, lease_token))
+        outcome = self.outcomes.pop(0) if self.outcomes else True
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class Job:
+    id = "job-1"
+    lease_token = "token-1"
+
+
+def run_heartbeat(queue, lease_seconds: float, duration: float) -> CancelToken:
+    async def main():
+        cancel_token = CancelToken()
+        worker = Worker(queue, lease_seconds=lease_seconds)
+        task = asyncio.ensure_future(worker._heartbeat(Job(), cancel_token))
+        await asyncio.sleep(duration)
+        task.cancel()
+        return cancel_token
+    return asyncio.run(main())
+
+
+def test_heartbeat_uses_lease_token():
+    queue = FlakyQueue([True, True])
+    cancel_token = run_heartbeat(queue, lease_seconds=0.3, duration=0.25)
+    assert queue.calls == [("job-1", "token-1"), ("job-1", "token-1")]
+    assert not cancel_token.cancelled
+
+
+def test_heartbeat_retries_after_queue_error():
+    queue = FlakyQueue([OSError("database is locked"), True, True, True])
+    cancel_token = run_heartbeat(queue, lease_seconds=0.3, duration=0.45)
+    assert len(queue.calls) >= 3
+    assert not cancel_token.cancelled
+
+
+def test_heartbeat_cancels_when_lease_cannot_be_renewed():
+    queue = FlakyQueue([OSError("database is locked")] * 10)
+    cancel_token = run_heartbeat(queue, lease_seconds=0.3, duration=0.45)
+    assert cancel_token.cancelled
+    assert cancel_token.reason == "リースの期限までにリースを延長できませんでした"
+
+
+def test_heartbeat_cancels_when_lease_is_lost():
+    queue = FlakyQueue([False])
+    cancel_token = run_heartbeat(queue, lease_seconds=0.3, duration=0.25)
+    assert cancel_token.cancelled
+    assert len(queue.calls) == 1